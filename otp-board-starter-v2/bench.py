@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark end-to-end של worker.py מול fixture_site.py (בלי האתר האמיתי ובלי SMS):
+מריץ N משימות בדפדפן headless ומדווח latency לכל step.
+
+  python bench.py --jobs 5 --layout mixed
+  python bench.py --jobs 10 --cross-origin --json before.json
+
+משתני הסביבה של ה-worker (SLOTS_DEEP, WAIT_POLL, BLOCK_RESOURCES, CHROME_BIN...) עוברים כרגיל,
+כך שאפשר להשוות שינויי ביצועים על אותה זרימה בדיוק.
+"""
+import os, sys, time, json, argparse, tempfile, collections
+
+def pct(values, q):
+    vals = sorted(values)
+    if not vals:
+        return 0.0
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+def step_key(title: str) -> str:
+    # "OPEN http://127.0.0.1:PORT/..." -> "OPEN"
+    return title.split(" http", 1)[0]
+
+def main():
+    ap = argparse.ArgumentParser(description="Run worker.py jobs against the offline fixture site")
+    ap.add_argument("--jobs", type=int, default=3)
+    ap.add_argument("--layout", choices=["single", "boxes", "mixed"], default="mixed",
+                    help="OTP layout: one field, one box per digit, or alternating")
+    ap.add_argument("--cross-origin", action="store_true", help="serve the phone iframe from another origin")
+    ap.add_argument("--days", type=int, default=7, help="calendar days on the fixture")
+    ap.add_argument("--latency", type=float, default=0.0, help="artificial server latency per request (s)")
+    ap.add_argument("--otp-delay", type=float, default=0.0, help="delay before the stand-in board sees the code (s)")
+    ap.add_argument("--headful", action="store_true")
+    ap.add_argument("--json", help="write raw samples and summary to this file")
+    args = ap.parse_args()
+
+    from fixture_site import OtpBoard, FixtureSite
+    token = "bench-token"
+    board = OtpBoard(token=token, otp_delay=args.otp_delay)
+    site = FixtureSite(board, layout=args.layout, cross_origin=args.cross_origin,
+                       days=args.days, latency=args.latency)
+    os.environ.update(OTP_API=board.start(), GOV_URL=site.start(), ADMIN_TOKEN=token,
+                      HEADLESS="0" if args.headful else "1")
+    # ה-fixture מגיש את ה-pathnames האמיתיים: סטטיסטיקת הסלקטורים וה-cache של ה-bench
+    # לא ייכתבו לקבצים שה-worker האמיתי קורא (selector_stats.json בתיקייה הנוכחית)
+    scratch = tempfile.mkdtemp(prefix="bench_worker_")
+    os.environ.update(SELECTOR_STATS_FILE=os.path.join(scratch, "selector_stats.json"),
+                      CHROME_CACHE_DIR=os.path.join(scratch, "chrome_cache"))
+
+    import worker  # אחרי שה-env מוכן: ה-worker קורא את הקונפיג בזמן import
+
+    samples = collections.defaultdict(list)
+    failures = collections.Counter()
+
+    def on_step(title, seconds, ok):
+        key = step_key(title)
+        samples[key].append(seconds)
+        if not ok:
+            failures[key] += 1
+
+    worker.STEP_HOOKS.append(on_step)
+    for i in range(args.jobs):
+        board.enqueue(f"05{i:08d}", {
+            "id_number": "123456782", "city": "חיפה", "branch": "סניף חיפה",
+            "date": "", "time_from": "08:00", "time_to": "12:00",
+        })
+
+    t0 = time.time()
+    try:
+        worker.main(max_jobs=args.jobs)
+    finally:
+        wall = time.time() - t0
+        site.stop()
+
+    try:
+        jobs = board.jobs()
+    finally:
+        board.stop()
+    results = collections.Counter(j["status"] for j in jobs)
+    reasons = collections.Counter(j["last_error"] for j in jobs if j["last_error"])
+
+    print()
+    print(f"{'step':<48} {'n':>3} {'mean':>7} {'p50':>7} {'p95':>7} {'max':>7} {'fail':>4}")
+    for key, vals in samples.items():
+        print(f"{key[:48]:<48} {len(vals):>3} {sum(vals) / len(vals):>7.2f} {pct(vals, .5):>7.2f} "
+              f"{pct(vals, .95):>7.2f} {max(vals):>7.2f} {failures[key]:>4}")
+    print(f"\njobs={args.jobs} wall={wall:.1f}s per_job={wall / max(1, args.jobs):.2f}s results={dict(results)}"
+          + (f" reasons={dict(reasons)}" if reasons else ""))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "args": vars(args), "wall": wall, "results": dict(results), "reasons": dict(reasons),
+                "steps": {k: {"samples": v, "fail": failures[k]} for k, v in samples.items()},
+            }, f, ensure_ascii=False, indent=2)
+    return 0 if results.get("done", 0) == args.jobs else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
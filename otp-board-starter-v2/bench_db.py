@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark של שכבת האחסון תחת תעבורה מעורבת: שליחות OTP (submit -> latest -> mark_used)
+במקביל ל-claims מהתור (enqueue -> next -> mark), דרך פונקציות ה-endpoints של server.py עצמן.
+
+  single – שתי הטבלאות בקובץ אחד, lock כתיבה ו-WAL משותפים (המבנה הקודם)
+  split  – otps.sqlite3 + login_queue.sqlite3, lock ו-WAL לכל אחד
+
+  python bench_db.py --seconds 10 --submitters 4 --claimers 4
+"""
+import os, sys, time, json, argparse, tempfile, threading, collections
+
+def pct(values, q):
+    vals = sorted(values)
+    if not vals:
+        return 0.0
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+def run(server, storage, mode: str, db_dir: str, seconds: float, submitters: int, claimers: int) -> dict:
+    if mode == "single":
+        both = lambda c: (storage.otp_schema(c), storage.queue_schema(c))
+        server.OTPS = server.QUEUE = storage.Store(os.path.join(db_dir, "single.sqlite3"), both)
+    else:
+        server.OTPS = storage.Store(os.path.join(db_dir, "otps.sqlite3"), storage.otp_schema,
+                                    autocheckpoint=server.OTP_WAL_AUTOCHECKPOINT)
+        server.QUEUE = storage.Store(os.path.join(db_dir, "login_queue.sqlite3"), storage.queue_schema,
+                                     autocheckpoint=server.QUEUE_WAL_AUTOCHECKPOINT)
+
+    lat = collections.defaultdict(list)
+    errors = collections.Counter()
+    stop = threading.Event()
+
+    def timed(name, fn, *a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return fn(*a, **kw)
+        except Exception as e:
+            errors[f"{name}: {type(e).__name__}"] += 1
+        finally:
+            lat[name].append((time.perf_counter() - t0) * 1000.0)
+
+    def submitter(n):
+        phone = f"0540000{n:03d}"
+        i = 0
+        while not stop.is_set():
+            i += 1
+            timed("otp.submit", server.submit, phone=phone, code=f"{i % 1000000:06d}")
+            d = timed("otp.latest", server.api_get_latest, phone=phone, _=True)
+            if d and d.get("id"):
+                timed("otp.mark_used", server.api_mark_used, id=d["id"], _=True)
+
+    def claimer(n):
+        while not stop.is_set():
+            timed("queue.enqueue", server.api_login_enqueue, server.LoginJobIn(phone=f"0520000{n:03d}"), _=True)
+            job = timed("queue.next", server.api_login_next, wait=0, _=True)
+            if job and job.get("id"):
+                timed("queue.mark", server.api_login_mark, id=job["id"], status="done", _=True)
+
+    threads = [threading.Thread(target=submitter, args=(i,)) for i in range(submitters)]
+    threads += [threading.Thread(target=claimer, args=(i,)) for i in range(claimers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    return {
+        "mode": mode, "wall": wall, "errors": dict(errors),
+        "ops": {k: {"n": len(v), "per_sec": len(v) / wall, "p50": pct(v, .5), "p95": pct(v, .95),
+                    "p99": pct(v, .99), "max": max(v)} for k, v in sorted(lat.items())},
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Mixed OTP submit / queue claim load: one SQLite file vs two")
+    ap.add_argument("--seconds", type=float, default=10.0, help="duration per mode")
+    ap.add_argument("--submitters", type=int, default=4, help="threads submitting OTPs")
+    ap.add_argument("--claimers", type=int, default=4, help="threads enqueueing and claiming jobs")
+    ap.add_argument("--modes", default="single,split")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    # server.py מתחבר ל-DB_DIR בזמן import – תיקייה זמנית, לא ה-data האמיתי
+    os.environ["DB_DIR"] = tempfile.mkdtemp(prefix="bench_db_")
+    import server, storage
+
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        db_dir = tempfile.mkdtemp(prefix=f"bench_db_{mode}_")
+        res = run(server, storage, mode, db_dir, args.seconds, args.submitters, args.claimers)
+        results.append(res)
+        print(f"\n== {mode}  ({args.submitters} submitters, {args.claimers} claimers, {res['wall']:.1f}s)")
+        print(f"{'op':<16} {'n':>7} {'ops/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>8}  (ms)")
+        for name, o in res["ops"].items():
+            print(f"{name:<16} {o['n']:>7} {o['per_sec']:>8.0f} {o['p50']:>7.2f} {o['p95']:>7.2f} "
+                  f"{o['p99']:>7.2f} {o['max']:>8.1f}")
+        if res["errors"]:
+            print("errors:", res["errors"])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Batched DOM probe: בודק רשימת סלקטורים מסודרת בקריאת execute_script אחת,
+במקום find_elements + is_displayed/is_enabled/get_attribute לכל מועמד (כל אחד round trip).
+
+selectors = [(By.CSS_SELECTOR, "..."), (By.XPATH, "..."), (By.ID, "..."), ...] לפי סדר עדיפות.
+orders    = {pathname: [אינדקסים לתוך selectors]} – סדר חלופי לפי הדף הנוכחי (location.pathname),
+            נבחר בתוך הדפדפן כך שאין round trip נוסף.
+"""
+import contextlib
+
+_PROBE_JS = """
+const sels = arguments[0], rules = arguments[1], orders = arguments[2] || {};
+const order = orders[location.pathname] || sels.map((_, i) => i);
+function shown(el) {
+    if (!el.isConnected) return false;
+    const st = getComputedStyle(el);
+    if (st.display === 'none' || st.visibility === 'hidden' || st.visibility === 'collapse' || +st.opacity === 0) return false;
+    if (el.tagName === 'INPUT' && (el.type || '').toLowerCase() === 'hidden') return false;
+    const r = el.getBoundingClientRect();
+    return el.getClientRects().length > 0 && (r.width > 0 || r.height > 0);
+}
+function enabled(el) {
+    if (el.disabled || (el.closest && el.closest('fieldset[disabled]'))) return false;
+    const a = (el.getAttribute('aria-disabled') || '').toLowerCase();
+    return !(rules.aria && (a === 'true' || a === '1'));
+}
+function query(how, sel) {
+    try {
+        if (how === 'css selector') return [...document.querySelectorAll(sel)];
+        if (how === 'id') { const e = document.getElementById(sel); return e ? [e] : []; }
+        if (how === 'name') return [...document.getElementsByName(sel)];
+        if (how === 'tag name') return [...document.getElementsByTagName(sel)];
+        if (how === 'xpath') {
+            const snap = document.evaluate(sel, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            const out = [];
+            for (let i = 0; i < snap.snapshotLength; i++) {
+                const n = snap.snapshotItem(i);
+                if (n.nodeType === 1) out.push(n);
+            }
+            return out;
+        }
+    } catch (e) {}
+    return [];
+}
+for (const i of order) {
+    let els = query(sels[i][0], sels[i][1]);
+    if (rules.visible) els = els.filter(shown);
+    if (rules.enabled) els = els.filter(enabled);
+    if (els.length < (rules.min_count || 1)) continue;
+    const el = els[0];
+    if (rules.unblock) {
+        for (const e of (rules.multiple ? els : [el])) {
+            e.removeAttribute('disabled');
+            e.setAttribute('aria-disabled', 'false');
+            e.classList && e.classList.remove('disabled');
+        }
+    }
+    if (rules.scroll) { try { el.scrollIntoView({block: 'center'}); } catch (e) {} }
+    return [rules.multiple ? els : el, i, location.pathname];
+}
+return null;
+"""
+
+def locate(driver, selectors, *, visible=True, enabled=False, aria=False,
+           unblock=False, scroll=False, multiple=False, min_count=1, orders=None):
+    """
+    מחזיר (element, index, pathname) של הסלקטור הראשון שיש לו מועמד שעומד בכללים, או (None, None, None).
+      visible   – כמו is_displayed()
+      enabled   – כמו is_enabled(); aria=True מחשיב גם aria-disabled="true" כמנוטרל
+      unblock   – מסיר disabled/aria-disabled מהמנצח
+      scroll    – scrollIntoView למנצח (חוסך round trip לפני click)
+      multiple  – מחזיר את כל המועמדים של הסלקטור המנצח (רשימה), בכפוף ל-min_count
+    """
+    rules = {"visible": visible, "enabled": enabled, "aria": aria, "unblock": unblock,
+             "scroll": scroll, "multiple": multiple, "min_count": min_count}
+    try:
+        res = driver.execute_script(_PROBE_JS, [list(s) for s in selectors], rules, orders or {})
+    except Exception:
+        return None, None, None
+    if not res:
+        return None, None, None
+    return res[0], res[1], res[2]
+
+def first(driver, selectors, **rules):
+    return locate(driver, selectors, **rules)[0]
+
+def click(driver, el) -> bool:
+    """קליק רגיל, ונפילה ל-JS click אם נחסם."""
+    try:
+        el.click()
+        return True
+    except Exception:
+        with contextlib.suppress(Exception):
+            driver.execute_script("arguments[0].click();", el)
+            return True
+    return False
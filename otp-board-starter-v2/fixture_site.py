@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+אתר fixture מקומי שמחקה את זרימת govisit + stand-in ל-OTP Board, להרצת worker.py בלי האתר
+האמיתי ובלי SMS אמיתי (ראו bench.py).
+
+  FixtureSite – info (continue_1870_29) -> iframe טלפון -> OTP (שדה יחיד / תיבה לכל ספרה)
+                -> מספר זהות -> מסננים -> לוח ימים ושעות (XHR /api/availability, /api/slots)
+  OtpBoard    – server.py עצמו (uvicorn ב-thread, DB זמני): long-poll, not_before, retry/backoff
+                בדיוק כמו בפרודקשן; קוד שנשלח ב"SMS" נשלח ל-/submit אחרי otp_delay שניות.
+
+הרצה ידנית:  python fixture_site.py --port 8800 --board-port 8801
+"""
+import os, json, random, socket, tempfile, threading, time, argparse, contextlib
+import urllib.request
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+APPT = "/he/app/appointment/29/1870"
+
+def _page(title: str, body: str, script: str = "") -> str:
+    return f"""<!doctype html><html dir="rtl" lang="he"><head><meta charset="utf-8">
+<title>{title}</title>
+<style>body{{font-family:sans-serif;margin:2rem}} label{{display:block;margin-top:.6rem}}
+button{{margin:.3rem}} .slot{{min-width:4rem}} .selected{{background:#0a58ca;color:#fff}}</style>
+</head><body>{body}<script>{script}</script></body></html>"""
+
+# כמו באתר: כותרת, שדה ומתחתיו הכפתור, בזרימה רגילה של הדף
+PHONE_FRAME = """<!doctype html><html dir="rtl" lang="he"><head><meta charset="utf-8">
+<style>body{font-family:sans-serif;margin:1rem} label{display:block;margin-bottom:.3rem}
+button{margin-top:.8rem}</style></head><body>
+<p>לקבלת קוד חד-פעמי יש להזין את מספר הטלפון הנייד</p>
+<form method="post" action="__ACTION__" target="_top">
+  <label for="tel">מספר טלפון נייד</label><input id="tel" type="tel" name="phone" autocomplete="tel">
+  <div><button type="submit">שלח קוד</button></div>
+</form></body></html>"""
+
+OTP_SINGLE = """
+<h2>אימות</h2><form id="f">
+  <label>קוד אימות</label>
+  <input name="code" autocomplete="one-time-code" inputmode="numeric" maxlength="6">
+  <button type="submit" id="login" disabled>התחברות</button>
+</form>"""
+
+OTP_BOXES = """
+<h2>אימות</h2><form id="f"><div id="boxes">__BOXES__</div>
+  <button type="submit" id="login" disabled>התחברות</button>
+</form>"""
+
+OTP_SCRIPT = """
+const f = document.getElementById('f'), btn = document.getElementById('login');
+const inputs = [...f.querySelectorAll('input')];
+const code = () => inputs.map(i => i.value).join('');
+inputs.forEach((inp, i) => inp.addEventListener('input', () => {
+  if (inputs.length > 1 && inp.value && inputs[i + 1]) inputs[i + 1].focus();
+  btn.disabled = code().length < 6;
+}));
+f.addEventListener('submit', async e => {
+  e.preventDefault();
+  const r = await fetch('/api/verify', {method: 'POST', body: JSON.stringify({code: code()})});
+  if (r.ok) location.href = '__NEXT__';
+  else document.body.insertAdjacentHTML('beforeend', '<p id="err">קוד שגוי</p>');
+});"""
+
+ID_PAGE = """
+<h2>פרטים אישיים</h2>
+<div><label>מספר זהות</label><input name="idNumber" inputmode="numeric" maxlength="9"></div>
+<button onclick="location.href='__NEXT__'">השלב הבא</button>"""
+
+FILTERS_PAGE = """
+<h2>חיפוש תור</h2>
+<div><label>עיר</label><select name="city"><option></option><option>חיפה</option><option>חולון</option><option>ירושלים</option></select></div>
+<div><label>סניף</label><select name="branch"><option></option><option>סניף חיפה</option><option>סניף חולון</option><option>סניף ירושלים</option></select></div>
+<div><label>תאריך</label><input type="date" name="date"></div>
+<div><label>שעת התחלה</label><input type="time" name="from"></div>
+<div><label>שעת סיום</label><input type="time" name="to"></div>
+<button onclick="location.href='__NEXT__'">חפש תורים</button>"""
+
+CALENDAR_PAGE = """
+<h2 id="hdr">תאריך: טוען...</h2><div id="days"></div><ul id="slots"></ul>"""
+
+CALENDAR_SCRIPT = """
+const days = document.getElementById('days'), slots = document.getElementById('slots');
+async function show(d, btn) {
+  [...days.children].forEach(b => { b.classList.remove('selected'); b.setAttribute('aria-pressed', 'false'); });
+  btn.classList.add('selected'); btn.setAttribute('aria-pressed', 'true');
+  const r = await fetch('/api/slots?day=' + d);
+  const data = await r.json();
+  document.getElementById('hdr').textContent = 'תאריך: ' + d;
+  slots.innerHTML = data.times.map(t => '<li><button class="slot">' + t + '</button></li>').join('');
+}
+fetch('/api/availability').then(r => r.json()).then(data => {
+  data.days.forEach((d, i) => {
+    const b = document.createElement('button');
+    b.textContent = String(Number(d.date.slice(8)));
+    b.setAttribute('aria-label', d.date);
+    if (!d.times.length) { b.disabled = true; b.setAttribute('aria-disabled', 'true'); }
+    b.onclick = () => show(d.date, b);
+    days.appendChild(b);
+  });
+  const first = [...days.children].find(b => !b.disabled);
+  if (first) show(first.getAttribute('aria-label'), first);
+});"""
+
+
+class OtpBoard:
+    """
+    server.py האמיתי על DB זמני, כדי שה-benchmark ירוץ מול אותו חוזה שה-worker מדבר איתו
+    בפרודקשן (long-poll עם wait, not_before, reason + retry/backoff). דורש fastapi + uvicorn.
+    """
+
+    def __init__(self, token: str = "bench-token", otp_delay: float = 0.0):
+        self.token = token
+        self.otp_delay = otp_delay
+        self.db_dir = tempfile.mkdtemp(prefix="otp_board_")
+        self.url = None
+        self._uv = None
+        self._thread = None
+
+    def _call(self, method: str, path: str, params: dict = None, json_body=None, form: dict = None):
+        url = self.url + path + (f"?{urlencode(params)}" if params else "")
+        headers = {"Authorization": f"Bearer {self.token}"}
+        data = None
+        if json_body is not None:
+            data, headers["Content-Type"] = json.dumps(json_body).encode(), "application/json"
+        elif form is not None:
+            data, headers["Content-Type"] = urlencode(form).encode(), "application/x-www-form-urlencoded"
+        req = urllib.request.Request(url, data=data, headers=headers, method=method)
+        with urllib.request.urlopen(req, timeout=30) as r:
+            body = r.read()
+        return json.loads(body) if body and r.headers.get_content_type() == "application/json" else None
+
+    def enqueue(self, phone: str, payload: dict) -> int:
+        return self._call("POST", "/api/login/enqueue", json_body={"phone": phone, **payload})["id"]
+
+    def sms_sent(self, phone: str, code: str):
+        def submit():
+            with contextlib.suppress(Exception):
+                self._call("POST", "/submit", form={"phone": phone, "code": code})
+        if self.otp_delay > 0:
+            threading.Timer(self.otp_delay, submit).start()
+        else:
+            submit()
+
+    def jobs(self) -> list:
+        """כל המשימות (status, attempts, last_error...) דרך /api/login/list."""
+        out, cursor = [], ""
+        while True:
+            page = self._call("GET", "/api/login/list", params={"limit": 200, "cursor": cursor})
+            out += page["items"]
+            cursor = page["next_cursor"]
+            if not cursor:
+                return out
+
+    def start(self, port: int = 0) -> str:
+        os.environ["DB_DIR"] = self.db_dir
+        os.environ["ADMIN_TOKEN"] = self.token
+        import uvicorn, server, storage
+        # אם server כבר יובא (board נוסף באותו תהליך) – מפנים אותו ל-DB ולטוקן של ה-board הזה
+        server.ADMIN_TOKEN = self.token
+        server.OTPS = storage.Store(os.path.join(self.db_dir, "otps.sqlite3"), storage.otp_schema)
+        server.QUEUE = storage.Store(os.path.join(self.db_dir, "login_queue.sqlite3"), storage.queue_schema)
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", port))
+        self._uv = uvicorn.Server(uvicorn.Config(server.app, log_level="warning"))
+        self._thread = threading.Thread(target=self._uv.run, kwargs={"sockets": [sock]}, name="otp-board", daemon=True)
+        self._thread.start()
+        while not self._uv.started:
+            time.sleep(0.02)
+        self.url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        return self.url
+
+    def stop(self):
+        if self._uv:
+            self._uv.should_exit = True
+            self._thread.join(timeout=5)
+
+
+class FixtureSite:
+    """
+    layout: 'single' | 'boxes' | 'mixed' (לסירוגין לפי מספר ה-SMS)
+    cross_origin: ה-iframe של הטלפון נטען מ-localhost בעוד הדף הראשי מ-127.0.0.1
+    """
+
+    def __init__(self, board: OtpBoard, layout: str = "single", cross_origin: bool = False,
+                 days: int = 7, latency: float = 0.0):
+        self.board = board
+        self.layout = layout
+        self.cross_origin = cross_origin
+        self.days = days
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.last_code = None
+        self.sms_count = 0
+        self.server = None
+        self.port = 0
+        rnd = random.Random(1870)
+        start = date.today() + timedelta(days=1)
+        self.availability = []
+        for i in range(days):
+            d = (start + timedelta(days=i)).isoformat()
+            times = sorted({f"{h:02d}:{m:02d}" for h in range(8, 15) for m in (0, 20, 40) if rnd.random() < 0.35})
+            self.availability.append({"date": d, "times": times if i % 4 != 3 else []})
+
+    @property
+    def gov_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{APPT}/info"
+
+    def _layout_for(self, n: int) -> str:
+        if self.layout == "mixed":
+            return "single" if n % 2 else "boxes"
+        return self.layout
+
+    def get(self, path: str, q: dict):
+        main = f"http://127.0.0.1:{self.port}"
+        if path == f"{APPT}/info":
+            return 200, "text/html", _page("מידע על השירות", f"""
+<h1>זימון תור – מידע</h1><p>יש להצטייד בתעודה מזהה.</p>
+<button id="continue_1870_29" onclick="location.href='{APPT}/login'">להמשך זימון</button>""")
+        if path == f"{APPT}/login":
+            host = "localhost" if self.cross_origin else "127.0.0.1"
+            return 200, "text/html", _page("כניסה", f"""
+<h2>הזדהות</h2><iframe src="http://{host}:{self.port}/auth/phone-frame" width="520" height="260"></iframe>""")
+        if path == "/auth/phone-frame":
+            return 200, "text/html", PHONE_FRAME.replace("__ACTION__", f"{main}/auth/send")
+        if path == "/auth/verify":
+            layout = q.get("layout", "single")
+            if layout == "boxes":
+                boxes = "".join(f'<input type="number" name="d{i}" maxlength="1" aria-label="ספרה {i}" style="width:2.5rem">'
+                                for i in range(1, 7))
+                body = OTP_BOXES.replace("__BOXES__", boxes)
+            else:
+                body = OTP_SINGLE
+            return 200, "text/html", _page("אימות", body, OTP_SCRIPT.replace("__NEXT__", f"{APPT}/id"))
+        if path == f"{APPT}/id":
+            return 200, "text/html", _page("פרטים", ID_PAGE.replace("__NEXT__", f"{APPT}/filters"))
+        if path == f"{APPT}/filters":
+            return 200, "text/html", _page("חיפוש", FILTERS_PAGE.replace("__NEXT__", f"{APPT}/calendar"))
+        if path == f"{APPT}/calendar":
+            return 200, "text/html", _page("לוח תורים", CALENDAR_PAGE, CALENDAR_SCRIPT)
+        if path == "/api/availability":
+            return 200, "application/json", json.dumps({"days": self.availability})
+        if path == "/api/slots":
+            day = next((d for d in self.availability if d["date"] == q.get("day")), None)
+            return 200, "application/json", json.dumps({"date": q.get("day"), "times": day["times"] if day else []})
+        return 404, "text/plain", "not found"
+
+    def post(self, path: str, q: dict, body: bytes):
+        if path == "/auth/send":
+            phone = parse_qs(body.decode("utf-8")).get("phone", [""])[0]
+            phone = "".join(ch for ch in phone if ch.isdigit())
+            code = f"{random.randint(0, 999999):06d}"
+            with self.lock:
+                self.sms_count += 1
+                layout = self._layout_for(self.sms_count)
+                self.last_code = code
+            self.board.sms_sent(phone, code)
+            return 303, f"http://127.0.0.1:{self.port}/auth/verify?layout={layout}"
+        if path == "/api/verify":
+            try:
+                code = json.loads(body or b"{}").get("code")
+            except ValueError:
+                code = None
+            with self.lock:
+                ok = bool(code) and code == self.last_code
+            return (200 if ok else 400), None
+        return 404, None
+
+    def start(self, port: int = 0) -> str:
+        site = self
+
+        class Handler(_Handler):
+            def route(self, method):
+                if site.latency:
+                    time.sleep(site.latency)
+                u = urlsplit(self.path)
+                q = {k: v[0] for k, v in parse_qs(u.query).items()}
+                if method == "GET":
+                    code, ctype, text = site.get(u.path, q)
+                    self.send_text(text, ctype, code)
+                    return
+                n = int(self.headers.get("Content-Length") or 0)
+                code, location = site.post(u.path, q, self.rfile.read(n) if n else b"")
+                if code == 303:
+                    self.send_response(303)
+                    self.send_header("Location", location)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self.send_json({"ok": code == 200}, code)
+
+        self.server = _serve(port, Handler)
+        self.port = self.server.server_address[1]
+        return self.gov_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def send_text(self, text: str, ctype: str, code: int = 200):
+        data = text.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", f"{ctype}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, obj, code: int = 200):
+        self.send_text(json.dumps(obj, ensure_ascii=False), "application/json", code)
+
+
+def _serve(port: int, handler) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name=f"fixture-{srv.server_address[1]}", daemon=True).start()
+    return srv
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Offline fixture of the govisit flow + OTP board stand-in")
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--board-port", type=int, default=8801)
+    ap.add_argument("--layout", choices=["single", "boxes", "mixed"], default="single")
+    ap.add_argument("--cross-origin", action="store_true")
+    ap.add_argument("--token", default="bench-token")
+    args = ap.parse_args()
+    board = OtpBoard(token=args.token)
+    board_url = board.start(args.board_port)
+    site = FixtureSite(board, layout=args.layout, cross_origin=args.cross_origin)
+    gov_url = site.start(args.port)
+    board.enqueue("0501234567", {"id_number": "123456782", "city": "חיפה", "branch": "סניף חיפה"})
+    print(f"GOV_URL={gov_url}\nOTP_API={board_url}\nADMIN_TOKEN={args.token}")
+    with contextlib.suppress(KeyboardInterrupt):
+        while True:
+            time.sleep(3600)
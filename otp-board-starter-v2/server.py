@@ -1,23 +1,89 @@
 # -*- coding: utf-8 -*-
-import os, json, sqlite3, re
+import os, io, sys, csv, json, re, threading, time, base64, contextvars, functools, inspect
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Optional
+from zoneinfo import ZoneInfo
 
 from fastapi import FastAPI, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.routing import APIRoute
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import BaseModel
+
+import storage
 
 # ---------- Config ----------
 DB_DIR = Path(os.getenv("DB_DIR", "data")); DB_DIR.mkdir(parents=True, exist_ok=True)
-DB_PATH = DB_DIR / "otp_store.sqlite3"
+LEGACY_DB_PATH = DB_DIR / "otp_store.sqlite3"  # קובץ משותף ישן; מועבר אוטומטית בעלייה
+# checkpoint נפרד לכל DB: התור קטן ומתעדכן הרבה – WAL קצר שומר על קריאות מהירות
+OTP_WAL_AUTOCHECKPOINT   = int(os.getenv("OTP_WAL_AUTOCHECKPOINT", "1000"))
+QUEUE_WAL_AUTOCHECKPOINT = int(os.getenv("QUEUE_WAL_AUTOCHECKPOINT", "200"))
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "change-me")
 OTP_TTL_SEC = int(os.getenv("OTP_TTL_SEC", "600"))  # ברירת מחדל: 10 דק'
+LOCAL_TZ = ZoneInfo(os.getenv("LOCAL_TZ", "Asia/Jerusalem"))  # לפרש זמנים ללא אזור זמן (07:55)
+LONG_POLL_MAX_SEC = float(os.getenv("LONG_POLL_MAX_SEC", "30"))
+# ההתעוררות דרך _QUEUE_COND היא בתוך התהליך בלבד; עם כמה workers של uvicorn משימה שנכנסה בתהליך אחר
+# נראית רק בבדיקה חוזרת של ה-DB – לכן כל המתנה נחתכת לפרוסות של LONG_POLL_RECHECK_SEC
+LONG_POLL_RECHECK_SEC = float(os.getenv("LONG_POLL_RECHECK_SEC", "1.0"))
+# כל long-poll מחזיק thread של ה-threadpool (שמשרת גם את /submit); מעבר לתקרה – תשובה מיידית בלי המתנה
+LONG_POLL_MAX_WAITERS = int(os.getenv("LONG_POLL_MAX_WAITERS", "8"))
+LIST_MAX_LIMIT = int(os.getenv("LIST_MAX_LIMIT", "200"))  # תקרת גודל עמוד ב-/api/*/list
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "1000"))  # שורות לכל עמוד (טרנזקציית קריאה) ב-/api/export
+# פרופיילינג (כבוי כש-PROFILE_DIR ריק): כל בקשה N-ית, או בקשה עם X-Profile: 1 + טוקן אדמין
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+PROFILE_SAMPLE_N = int(os.getenv("PROFILE_SAMPLE_N", "0"))        # 0 = רק לפי header
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+# כשלים שה-worker מדווח (reason) ושמחזירים לתור עם backoff אקספוננציאלי; כל השאר נשארים failed
+RETRYABLE_REASONS = {r.strip() for r in os.getenv(
+    "RETRYABLE_REASONS",
+    "api_error,page_timeout,driver_error,radware_blocked,no_continue_button,no_phone_field,sms_not_sent"
+).split(",") if r.strip()}
+RETRY_BASE_SEC     = float(os.getenv("RETRY_BASE_SEC", "30"))
+RETRY_MAX_SEC      = float(os.getenv("RETRY_MAX_SEC", "1800"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
 AUTH = HTTPBearer(auto_error=False)
 
+def iso(dt: datetime) -> str:
+    # רוחב קבוע (תמיד עם מיקרו-שניות) כדי שהשוואת מחרוזות ב-SQLite תהיה כרונולוגית
+    return dt.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
 def utcnow_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+    return iso(datetime.now(timezone.utc))
+
+def parse_when(value: str) -> str:
+    """
+    '' -> עכשיו; 'HH:MM' -> המופע הבא של השעה (LOCAL_TZ); ISO datetime (ללא אזור זמן = LOCAL_TZ).
+    מחזיר ISO ב-UTC.
+    """
+    v = (value or "").strip()
+    if not v:
+        return utcnow_iso()
+    now = datetime.now(LOCAL_TZ)
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})", v)
+    if not m:
+        return parse_ts(v)
+    try:
+        dt = now.replace(hour=int(m.group(1)), minute=int(m.group(2)), second=0, microsecond=0)
+    except ValueError:
+        raise HTTPException(400, f"invalid time: {v}")
+    if dt <= now:
+        dt += timedelta(days=1)
+    return iso(dt)
+
+def parse_ts(value: str) -> Optional[str]:
+    """ISO date/datetime (ללא אזור זמן = LOCAL_TZ) -> ISO ב-UTC; '' -> None."""
+    v = (value or "").strip()
+    if not v:
+        return None
+    try:
+        dt = datetime.fromisoformat(v.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(400, f"invalid time: {v}")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=LOCAL_TZ)
+    return iso(dt)
 
 def normalize_phone(p: str) -> str:
     # שומר רק ספרות; הופך 9725... ל-05...
@@ -29,33 +95,29 @@ def normalize_phone(p: str) -> str:
 def normalize_code(c: str) -> str:
     return re.sub(r"\D+", "", c or "")
 
-def connect():
-    c = sqlite3.connect(DB_PATH)
-    c.row_factory = sqlite3.Row
-    # קצת כיוונוני יציבות
-    c.execute("PRAGMA journal_mode=WAL;")
-    c.execute("PRAGMA synchronous=NORMAL;")
-    # סכמות
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS otps(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        phone TEXT NOT NULL,
-        code TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        used INTEGER NOT NULL DEFAULT 0
-    )""")
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS login_queue(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        phone TEXT NOT NULL,
-        status TEXT NOT NULL DEFAULT 'queued',
-        payload TEXT NOT NULL DEFAULT '{}',
-        created_at TEXT NOT NULL
-    )""")
-    # אינדקסים שימושיים
-    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_phone_created ON otps(phone, created_at DESC)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_status_created ON login_queue(status, created_at)")
-    return c
+# ---------- Storage ----------
+OTPS  = storage.Store(DB_DIR / "otps.sqlite3", storage.otp_schema, autocheckpoint=OTP_WAL_AUTOCHECKPOINT)
+QUEUE = storage.Store(DB_DIR / "login_queue.sqlite3", storage.queue_schema, autocheckpoint=QUEUE_WAL_AUTOCHECKPOINT)
+storage.migrate_legacy(LEGACY_DB_PATH, OTPS, QUEUE)
+
+# ---------- Queue wakeups ----------
+# long-poll של /api/login/next ממתין כאן; מתעורר בהוספה/שינוי בתור או כשהמשימה הבאה מגיע זמנה
+_QUEUE_COND = threading.Condition()
+_queue_gen = 0
+_LONG_POLL_SLOTS = threading.BoundedSemaphore(max(1, LONG_POLL_MAX_WAITERS))
+
+def queue_changed():
+    global _queue_gen
+    with _QUEUE_COND:
+        _queue_gen += 1
+        _QUEUE_COND.notify_all()
+
+def enqueue_login(c, phone: str, payload: dict, not_before: str, repeat_sec: Optional[int]) -> int:
+    cur = c.execute(
+        "INSERT INTO login_queue(phone, status, payload, created_at, not_before, repeat_sec) VALUES(?, 'queued', ?, ?, ?, ?)",
+        (phone, json.dumps(payload, ensure_ascii=False), utcnow_iso(), not_before, repeat_sec or None)
+    )
+    return cur.lastrowid
 
 # אם אין תיקיית static, לא למפות
 if Path("static").exists():
@@ -70,6 +132,124 @@ def require_token(creds: HTTPAuthorizationCredentials = Depends(AUTH)):
         raise HTTPException(status_code=401, detail="Unauthorized")
     return True
 
+# ---------- Profiling ----------
+class StackSampler:
+    """
+    sampling profiler: thread רקע דוגם את sys._current_frames() כל PROFILE_INTERVAL_MS.
+    ה-endpoints סינכרוניים ורצים ב-threadpool, כך ש-cProfile על ה-event loop לא היה רואה אותם;
+    נדגמים רק ה-threads שב-self.threads – ה-handler של הבקשה הזו רושם שם את ה-ident שלו
+    (_ProfiledRoute), ולא כל thread אחר שבמקרה מריץ בקשה מקבילה.
+    הפלט בפורמט speedscope (https://www.speedscope.app), profile לכל thread.
+    """
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000.0
+        self.frames, self.index = [], {}
+        self.threads = set()  # idents של ה-handler, נרשמים מתוך ה-thread עצמו
+        self.samples = {}  # thread id -> ([stack...], [weight...])
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _frame_id(self, code) -> int:
+        i = self.index.get(code)
+        if i is None:
+            i = self.index[code] = len(self.frames)
+            self.frames.append({"name": getattr(code, "co_qualname", code.co_name),
+                                "file": code.co_filename, "line": code.co_firstlineno})
+        return i
+
+    def _run(self):
+        me, last = threading.get_ident(), time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = (now - last) * 1000.0, now
+            for tid, frame in sys._current_frames().items():
+                if tid == me or tid not in self.threads:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                stacks, weights = self.samples.setdefault(tid, ([], []))
+                stacks.append([self._frame_id(c) for c in reversed(codes)])
+                weights.append(weight)
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed_ms = (time.perf_counter() - self.t0) * 1000.0
+
+    def write_speedscope(self, path: str, name: str):
+        profiles = [{
+            "type": "sampled", "name": f"{name} [thread {tid}]", "unit": "milliseconds",
+            "startValue": 0, "endValue": self.elapsed_ms, "samples": stacks, "weights": weights,
+        } for tid, (stacks, weights) in self.samples.items()]
+        doc = {"$schema": "https://www.speedscope.app/file-format-schema.json", "name": name,
+               "exporter": "otp-board", "shared": {"frames": self.frames}, "profiles": profiles}
+        with open(path, "w") as f:
+            json.dump(doc, f)
+
+# ה-sampler של הבקשה הנוכחית; anyio מעתיק את ה-context ל-thread של ה-threadpool
+_PROFILE_SAMPLER = contextvars.ContextVar("profile_sampler", default=None)
+
+def _record_handler_thread(endpoint):
+    """עוטף endpoint כך שירשום ל-sampler של הבקשה (אם יש) את ה-thread שמריץ אותו."""
+    def mark():
+        sampler = _PROFILE_SAMPLER.get()
+        if sampler is not None:
+            sampler.threads.add(threading.get_ident())
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def run(*a, **kw):
+            mark()
+            return await endpoint(*a, **kw)
+    else:
+        @functools.wraps(endpoint)
+        def run(*a, **kw):
+            mark()
+            return endpoint(*a, **kw)
+    return run
+
+class _ProfiledRoute(APIRoute):
+    def __init__(self, path, endpoint, **kw):
+        super().__init__(path, _record_handler_thread(endpoint), **kw)
+
+if PROFILE_DIR:
+    # נרשם רק כשמופעל – בלי PROFILE_DIR אין middleware, אין עטיפת endpoints ואין שום תקורה לבקשה
+    Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+    app.router.route_class = _ProfiledRoute  # לפני ה-@app.get/post שלמטה
+    _profile_count = 0
+
+    @app.middleware("http")
+    async def profile_requests(request, call_next):
+        global _profile_count
+        _profile_count += 1
+        wanted = (request.headers.get("x-profile") == "1"
+                  and request.headers.get("authorization") == f"Bearer {ADMIN_TOKEN}")
+        if not wanted and not (PROFILE_SAMPLE_N > 0 and _profile_count % PROFILE_SAMPLE_N == 0):
+            return await call_next(request)
+        sampler = StackSampler(PROFILE_INTERVAL_MS)
+        token = _PROFILE_SAMPLER.set(sampler)
+        sampler.start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+            _PROFILE_SAMPLER.reset(token)
+        name = f"{request.method} {request.url.path}"
+        path = os.path.join(PROFILE_DIR, "req_%d_%s_%s.speedscope.json" % (
+            int(time.time() * 1000), request.method, re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_") or "root"))
+        try:
+            sampler.write_speedscope(path, name)
+            response.headers["X-Profile-File"] = os.path.basename(path)
+        except OSError:
+            pass
+        return response
+
 # ---------- UI ----------
 @app.get("/", response_class=HTMLResponse)
 def index():
@@ -108,6 +288,14 @@ def index():
       <label class="form-label">שעת סיום (HH:MM)</label>
       <input name="time_to" class="form-control" placeholder="12:00">
     </div>
+    <div class="col-md-3">
+      <label class="form-label">מתי להריץ (ריק = עכשיו)</label>
+      <input name="not_before" type="datetime-local" class="form-control">
+    </div>
+    <div class="col-md-3">
+      <label class="form-label">חזרה כל X דקות (אופציונלי)</label>
+      <input name="repeat_min" type="number" min="1" class="form-control" placeholder="1440 = כל יום">
+    </div>
     <div class="col-md-12">
       <button class="btn btn-success">התחל התחברות וזימון</button>
     </div>
@@ -138,7 +326,9 @@ def login_request(
     branch: str = Form(default=""),
     date: str = Form(default=""),
     time_from: str = Form(default=""),
-    time_to: str = Form(default="")
+    time_to: str = Form(default=""),
+    not_before: str = Form(default=""),
+    repeat_min: str = Form(default="")
 ):
     payload = {
         "id_number": (id_number or "").strip(),
@@ -151,12 +341,13 @@ def login_request(
     p = normalize_phone(phone)
     if not p:
         raise HTTPException(400, "Phone is required")
+    repeat = (repeat_min or "").strip()
+    if repeat and not repeat.isdigit():
+        raise HTTPException(400, "repeat_min must be a number of minutes")
 
-    with connect() as c:
-        c.execute(
-            "INSERT INTO login_queue(phone, status, payload, created_at) VALUES(?, 'queued', ?, ?)",
-            (p, json.dumps(payload, ensure_ascii=False), utcnow_iso())
-        )
+    with QUEUE.write() as c:
+        enqueue_login(c, p, payload, parse_when(not_before), int(repeat) * 60 if repeat else None)
+    queue_changed()
     return RedirectResponse("/", status_code=303)
 
 @app.post("/submit")
@@ -166,7 +357,7 @@ def submit(phone: str = Form(...), code: str = Form(...)):
     if not p or not k:
         raise HTTPException(400, "Phone and code are required")
 
-    with connect() as c:
+    with OTPS.write() as c:
         c.execute(
             "INSERT INTO otps(phone, code, created_at, used) VALUES(?,?,?,0)",
             (p, k, utcnow_iso())
@@ -174,40 +365,143 @@ def submit(phone: str = Form(...), code: str = Form(...)):
     return RedirectResponse("/", status_code=303)
 
 # ---------- API used by ה-worker ----------
+class LoginJobIn(BaseModel):
+    phone: str
+    id_number: str = ""
+    city: str = ""
+    branch: str = ""
+    date: str = ""
+    time_from: str = ""
+    time_to: str = ""
+    not_before: Optional[str] = None   # ISO / HH:MM; ללא אזור זמן = LOCAL_TZ
+    repeat_sec: Optional[int] = None   # חזרה כל N שניות מה-not_before הקודם
+
+@app.post("/api/login/enqueue")
+def api_login_enqueue(job: LoginJobIn, _: bool = Depends(require_token)):
+    p = normalize_phone(job.phone)
+    if not p:
+        raise HTTPException(400, "Phone is required")
+    if job.repeat_sec is not None and job.repeat_sec < 60:
+        raise HTTPException(400, "repeat_sec must be at least 60")
+    payload = {k: (getattr(job, k) or "").strip()
+               for k in ("id_number", "city", "branch", "date", "time_from", "time_to")}
+    not_before = parse_when(job.not_before or "")
+    with QUEUE.write() as c:
+        jid = enqueue_login(c, p, payload, not_before, job.repeat_sec)
+    queue_changed()
+    return {"id": jid, "not_before": not_before}
+
+def _claim_next(c):
+    now = utcnow_iso()
+    row = c.execute(
+        """SELECT id, phone, payload, created_at, not_before, repeat_sec, attempts
+           FROM login_queue
+           WHERE status='queued' AND not_before <= ?
+           ORDER BY not_before ASC
+           LIMIT 1""",
+        (now,)
+    ).fetchone()
+    if not row:
+        return None
+    cur = c.execute(
+        "UPDATE login_queue SET status='processing', attempts=attempts+1 WHERE id=? AND status='queued'",
+        (row["id"],)
+    )
+    if cur.rowcount == 0:
+        return None
+    if row["repeat_sec"] and row["attempts"] == 0:
+        # משימה חוזרת: המופע הבא (מדלג על מופעים שכבר עברו); ניסיון חוזר של אותו מופע לא יוצר מופע נוסף
+        nxt = datetime.fromisoformat(row["not_before"])
+        behind = (datetime.fromisoformat(now) - nxt).total_seconds()
+        if behind >= 0:
+            nxt += timedelta(seconds=row["repeat_sec"] * (int(behind // row["repeat_sec"]) + 1))
+        enqueue_login(c, row["phone"], json.loads(row["payload"] or "{}"), iso(nxt), row["repeat_sec"])
+    return row
+
+def _next_due_in(c) -> Optional[float]:
+    row = c.execute("SELECT MIN(not_before) AS nb FROM login_queue WHERE status='queued'").fetchone()
+    if not row or not row["nb"]:
+        return None
+    due = datetime.fromisoformat(row["nb"])
+    return max(0.0, (due - datetime.now(timezone.utc)).total_seconds())
+
 @app.get("/api/login/next")
-def api_login_next(_: bool = Depends(require_token)):
-    with connect() as c:
-        row = c.execute(
-            """SELECT id, phone, payload, created_at
-               FROM login_queue
-               WHERE status='queued'
-               ORDER BY created_at ASC
-               LIMIT 1"""
-        ).fetchone()
-        if not row:
+def api_login_next(wait: float = 0, _: bool = Depends(require_token)):
+    """
+    wait>0 = long-poll: ממתין עד wait שניות (עד LONG_POLL_MAX_SEC) למשימה שזמנה הגיע.
+    מתעורר מיד בהוספה לתור בתהליך הזה, בדיוק כשהמשימה המתוזמנת הבאה מגיע זמנה,
+    ולכל היותר אחרי LONG_POLL_RECHECK_SEC (שינויים מתהליכים אחרים).
+    """
+    if wait > 0:
+        if _LONG_POLL_SLOTS.acquire(blocking=False):
+            try:
+                return _next_job(wait)
+            finally:
+                _LONG_POLL_SLOTS.release()
+        wait = 0  # כבר LONG_POLL_MAX_WAITERS ממתינים: בדיקה אחת, וה-worker ינסה שוב בעוד שנייה
+    return _next_job(wait)
+
+def _next_job(wait: float) -> dict:
+    deadline = time.monotonic() + min(max(wait, 0.0), LONG_POLL_MAX_SEC)
+    while True:
+        gen = _queue_gen
+        with QUEUE.write() as c:
+            row = _claim_next(c)
+            due_in = None if row else _next_due_in(c)
+        if row:
+            if row["repeat_sec"]:
+                queue_changed()
+            return {
+                "id": row["id"],
+                "phone": row["phone"],
+                "payload": json.loads(row["payload"] or "{}"),
+                "created_at": row["created_at"],
+                "not_before": row["not_before"],
+                "attempt": row["attempts"] + 1,
+            }
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
             return {"id": None}
-        c.execute("UPDATE login_queue SET status='processing' WHERE id=?", (row["id"],))
-        return {
-            "id": row["id"],
-            "phone": row["phone"],
-            "payload": json.loads(row["payload"] or "{}"),
-            "created_at": row["created_at"],
-        }
+        timeout = min(remaining, LONG_POLL_RECHECK_SEC)
+        if due_in is not None:
+            timeout = min(timeout, due_in + 0.01)
+        with _QUEUE_COND:
+            _QUEUE_COND.wait_for(lambda: _queue_gen != gen, timeout)
+
+def retry_delay(attempts: int) -> float:
+    # 30s, 60s, 120s... עד RETRY_MAX_SEC
+    return min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** max(0, attempts - 1))
 
 @app.post("/api/login/mark")
-def api_login_mark(id: int, status: str, _: bool = Depends(require_token)):
+def api_login_mark(id: int, status: str, reason: str = "", _: bool = Depends(require_token)):
+    """
+    status=failed עם reason מתוך RETRYABLE_REASONS מחזיר את המשימה לתור עם not_before=now+backoff
+    (עד RETRY_MAX_ATTEMPTS ניסיונות); long-poll של ה-worker יתעורר כשהזמן יגיע.
+    """
     if status not in ("done", "failed", "queued", "processing"):
         raise HTTPException(400, "invalid status")
-    with connect() as c:
-        cur = c.execute("UPDATE login_queue SET status=? WHERE id=?", (status, id))
-        if cur.rowcount == 0:
+    reason = (reason or "").strip()[:200] or None
+    retry_at = None
+    with QUEUE.write() as c:
+        row = c.execute("SELECT attempts FROM login_queue WHERE id=?", (id,)).fetchone()
+        if not row:
             raise HTTPException(404, "job not found")
-    return {"ok": True}
+        if status == "failed" and reason in RETRYABLE_REASONS and row["attempts"] < RETRY_MAX_ATTEMPTS:
+            status = "queued"
+            retry_at = iso(datetime.now(timezone.utc) + timedelta(seconds=retry_delay(row["attempts"])))
+            c.execute("UPDATE login_queue SET status='queued', not_before=?, last_error=? WHERE id=?",
+                      (retry_at, reason, id))
+        else:
+            c.execute("UPDATE login_queue SET status=?, last_error=COALESCE(?, last_error) WHERE id=?",
+                      (status, reason, id))
+    if status == "queued":
+        queue_changed()
+    return {"ok": True, "status": status, "attempts": row["attempts"], "retry_at": retry_at}
 
 @app.get("/api/otp/latest")
 def api_get_latest(phone: str, _: bool = Depends(require_token)):
     p = normalize_phone(phone)
-    with connect() as c:
+    with OTPS.read() as c:
         row = c.execute(
             "SELECT id, code, created_at FROM otps WHERE phone=? AND used=0 ORDER BY created_at DESC LIMIT 1",
             (p,)
@@ -226,6 +520,152 @@ def api_get_latest(phone: str, _: bool = Depends(require_token)):
 
 @app.post("/api/otp/mark_used")
 def api_mark_used(id: int, _: bool = Depends(require_token)):
-    with connect() as c:
+    with OTPS.write() as c:
         c.execute("UPDATE otps SET used=1 WHERE id=?", (id,))
     return {"ok": True}
+
+# ---------- Admin listing (keyset pagination) ----------
+def _encode_cursor(row) -> str:
+    raw = json.dumps([row["created_at"], row["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, rid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(created_at), int(rid)
+    except Exception:
+        raise HTTPException(400, "invalid cursor")
+
+def _list_page(c, table: str, cols: str, where: list, params: list,
+               since: str, until: str, cursor: str, limit: int) -> dict:
+    """
+    עמוד אחד, מהחדש לישן, לפי (created_at, id).
+    ה-cursor הוא המפתח של השורה האחרונה בעמוד הקודם, כך שכל עמוד הוא range scan על אינדקס –
+    בלי OFFSET, ובאותה עלות לא משנה כמה עמוקים בטבלה.
+    """
+    limit = max(1, min(limit, LIST_MAX_LIMIT))
+    where, params = list(where), list(params)
+    lo, hi = parse_ts(since), parse_ts(until)
+    if lo:
+        where.append("created_at >= ?"); params.append(lo)
+    if hi:
+        where.append("created_at < ?"); params.append(hi)
+    if cursor:
+        where.append("(created_at, id) < (?, ?)"); params.extend(_decode_cursor(cursor))
+    sql = f"SELECT {cols} FROM {table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    rows = c.execute(sql, params + [limit + 1]).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [dict(r) for r in rows],
+        "next_cursor": _encode_cursor(rows[-1]) if more else None,
+    }
+
+@app.get("/api/login/list")
+def api_login_list(status: str = "", phone: str = "", since: str = "", until: str = "",
+                   cursor: str = "", limit: int = 50, _: bool = Depends(require_token)):
+    where, params = [], []
+    if status:
+        where.append("status=?"); params.append(status)
+    if phone:
+        where.append("phone=?"); params.append(normalize_phone(phone))
+    with QUEUE.read() as c:
+        page = _list_page(
+            c, "login_queue",
+            "id, phone, status, payload, created_at, not_before, repeat_sec, attempts, last_error",
+            where, params, since, until, cursor, limit,
+        )
+    for item in page["items"]:
+        item["payload"] = json.loads(item["payload"] or "{}")
+    return page
+
+@app.get("/api/otp/list")
+def api_otp_list(used: Optional[bool] = None, phone: str = "", since: str = "", until: str = "",
+                 cursor: str = "", limit: int = 50, _: bool = Depends(require_token)):
+    where, params = [], []
+    if used is not None:
+        where.append("used=?"); params.append(int(used))
+    if phone:
+        where.append("phone=?"); params.append(normalize_phone(phone))
+    with OTPS.read() as c:
+        return _list_page(c, "otps", "id, phone, code, created_at, used",
+                          where, params, since, until, cursor, limit)
+
+# ---------- Export (streaming) ----------
+EXPORT_COLUMNS = {
+    "otps": ["id", "phone", "code", "created_at", "used"],
+    "login_queue": ["id", "phone", "status", "payload", "created_at", "not_before",
+                    "repeat_sec", "attempts", "last_error"],
+}
+
+def _export_rows(table: str, lo: Optional[str], hi: Optional[str]):
+    """
+    מחולל של chunks (רשימות שורות) – keyset על (created_at, id) כמו ב-_list_page, אבל בסדר עולה.
+    כל chunk הוא SELECT קצר בחיבור/טרנזקציית קריאה משלו, כך שהורדה איטית לא מחזיקה snapshot
+    פתוח ולא חוסמת checkpoint של ה-WAL. הזיכרון חסום ב-EXPORT_CHUNK, לא בגודל הטבלה.
+    (בלי snapshot אחד: שורה שהשתנתה באמצע הייצוא תופיע במצבה בזמן שה-chunk שלה נקרא.)
+    """
+    cols = EXPORT_COLUMNS[table]
+    store = OTPS if table == "otps" else QUEUE
+    base, params = [], []
+    if lo:
+        base.append("created_at >= ?"); params.append(lo)
+    if hi:
+        base.append("created_at < ?"); params.append(hi)
+    after = None
+    while True:
+        where, args = list(base), list(params)
+        if after:
+            where.append("(created_at, id) > (?, ?)"); args.extend(after)
+        sql = f"SELECT {', '.join(cols)} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at, id LIMIT ?"
+        with store.read() as c:
+            rows = c.execute(sql, args + [EXPORT_CHUNK]).fetchall()
+        if not rows:
+            break
+        yield rows
+        if len(rows) < EXPORT_CHUNK:
+            break
+        after = (rows[-1]["created_at"], rows[-1]["id"])
+
+def _ndjson(chunks):
+    for rows in chunks:
+        out = []
+        for r in rows:
+            d = dict(r)
+            if "payload" in d:
+                d["payload"] = json.loads(d["payload"] or "{}")
+            out.append(json.dumps(d, ensure_ascii=False))
+        yield "\n".join(out) + "\n"
+
+def _csv(chunks, cols):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(cols)
+    for rows in chunks:
+        w.writerows(tuple(r) for r in rows)
+        yield buf.getvalue()
+        buf.seek(0); buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+@app.get("/api/export/{table}")
+def api_export(table: str, format: str = "ndjson", since: str = "", until: str = "",
+               _: bool = Depends(require_token)):
+    if table not in EXPORT_COLUMNS:
+        raise HTTPException(404, "unknown table")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(400, "format must be ndjson or csv")
+    chunks = _export_rows(table, parse_ts(since), parse_ts(until))
+    if format == "csv":
+        body, media = _csv(chunks, EXPORT_COLUMNS[table]), "text/csv; charset=utf-8"
+    else:
+        body, media = _ndjson(chunks), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media, headers={
+        "Content-Disposition": f'attachment; filename="{table}.{format}"',
+    })
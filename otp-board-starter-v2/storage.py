@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+שכבת האחסון של server.py: כל משפחת טבלאות בקובץ SQLite משלה –
+  otps.sqlite3         – קודי OTP (submit / latest / mark_used)
+  login_queue.sqlite3  – תור ההתחברויות (enqueue / claim / mark)
+כך ששליחת OTP ו-claim מהתור לא מתחרים על אותו write lock ואותו WAL.
+
+לכל Store: lock כתיבה משלו בתוך התהליך (כותבים ממתינים בתור במקום busy-wait של SQLite)
+ו-wal_autocheckpoint משלו. migrate_legacy() מעביר את הקובץ המשותף הישן (otp_store.sqlite3).
+"""
+import sqlite3, threading, contextlib
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: אין flock, ה-migration מסתמך רק על בדיקת "היעד ריק" ב-_copy
+    fcntl = None
+
+class Store:
+    def __init__(self, path, schema, autocheckpoint: int = 1000, busy_timeout: float = 10.0):
+        self.path = Path(path)
+        self.schema = schema                  # schema(c): CREATE/ALTER, רץ פעם אחת לכל Store
+        self.autocheckpoint = autocheckpoint  # עמודי WAL לפני checkpoint אוטומטי
+        self.busy_timeout = busy_timeout      # מול תהליכים אחרים (ה-lock כאן מגן רק בתוך התהליך)
+        self.write_lock = threading.Lock()
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def connect(self, **kw):
+        c = sqlite3.connect(self.path, timeout=self.busy_timeout, **kw)
+        c.row_factory = sqlite3.Row
+        c.execute("PRAGMA journal_mode=WAL;")
+        c.execute("PRAGMA synchronous=NORMAL;")
+        c.execute(f"PRAGMA wal_autocheckpoint={int(self.autocheckpoint)};")
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self.schema(c)
+                    c.commit()
+                    self._ready = True
+        return c
+
+    @contextlib.contextmanager
+    def read(self, **kw):
+        c = self.connect(**kw)
+        try:
+            yield c
+        finally:
+            c.close()
+
+    @contextlib.contextmanager
+    def write(self):
+        """טרנזקציית כתיבה: lock של ה-Store + BEGIN IMMEDIATE; commit ביציאה, rollback בחריגה."""
+        with self.write_lock:
+            c = self.connect()
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                yield c
+                c.commit()
+            except BaseException:
+                c.rollback()
+                raise
+            finally:
+                c.close()
+
+# ---------- Schemas ----------
+def otp_schema(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS otps(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone TEXT NOT NULL,
+        code TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        used INTEGER NOT NULL DEFAULT 0
+    )""")
+    # (phone, created_at) בסדר עולה: משרת גם את ORDER BY created_at DESC, id DESC (סריקה הפוכה) בלי מיון זמני
+    c.execute("DROP INDEX IF EXISTS idx_otps_phone_created")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_phone_created_at ON otps(phone, created_at)")
+    # keyset של /api/*/list: (created_at, id) – ה-id (rowid) הוא חלק מכל אינדקס, אז אין צורך לציין אותו
+    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_created ON otps(created_at)")
+    # ?used=0/1 בלי phone: בלי האינדקס הזה הסינון רץ על idx_otps_created ומדלג על כל השורות שלא מתאימות
+    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_used_created ON otps(used, created_at)")
+    # phone+used (ה-latest וה-list עם שני הפילטרים): בלי זה, בלי sqlite_stat1, ה-planner עלול לבחור את (used, ...)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_otps_phone_used_created ON otps(phone, used, created_at)")
+
+def queue_schema(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS login_queue(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        payload TEXT NOT NULL DEFAULT '{}',
+        created_at TEXT NOT NULL,
+        not_before TEXT,
+        repeat_sec INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    )""")
+    # DB ישן: מוסיף not_before/repeat_sec/attempts/last_error; משימות קיימות זמינות מיד (not_before=created_at)
+    cols = {r[1] for r in c.execute("PRAGMA table_info(login_queue)")}
+    if "not_before" not in cols:
+        c.execute("ALTER TABLE login_queue ADD COLUMN not_before TEXT")
+    if "repeat_sec" not in cols:
+        c.execute("ALTER TABLE login_queue ADD COLUMN repeat_sec INTEGER")
+    if "attempts" not in cols:
+        c.execute("ALTER TABLE login_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    if "last_error" not in cols:
+        c.execute("ALTER TABLE login_queue ADD COLUMN last_error TEXT")
+    c.execute("UPDATE login_queue SET not_before=created_at WHERE not_before IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_status_created ON login_queue(status, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_status_not_before ON login_queue(status, not_before)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_created ON login_queue(created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_phone_created ON login_queue(phone, created_at)")
+    # ?status=&phone= ביחד: שני השוויונות ואז range על created_at
+    c.execute("CREATE INDEX IF NOT EXISTS idx_login_queue_status_phone_created ON login_queue(status, phone, created_at)")
+
+# ---------- Migration ----------
+OTP_COLUMNS = ["id", "phone", "code", "created_at", "used"]
+QUEUE_COLUMNS = ["id", "phone", "status", "payload", "created_at", "not_before", "repeat_sec", "attempts", "last_error"]
+
+def _copy(src, dst_store, table: str, cols: list, chunk: int = 5000) -> int:
+    names = ", ".join(cols)
+    marks = ", ".join("?" * len(cols))
+    n = 0
+    with dst_store.write() as dst:
+        if dst.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+            return 0  # היעד כבר מכיל נתונים (הרצה קודמת / תהליך אחר) – לא לשכפל
+        cur = src.execute(f"SELECT {names} FROM {table} ORDER BY id")
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            dst.executemany(f"INSERT INTO {table}({names}) VALUES({marks})", rows)
+            n += len(rows)
+        # AUTOINCREMENT: לא לחזור על ids שנמחקו בקובץ הישן
+        seq = src.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+        if seq:
+            dst.execute("UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name=?", (seq[0], table))
+    return n
+
+def migrate_legacy(legacy_path, otps: Store, queue: Store) -> dict:
+    """
+    מעביר otps/login_queue מהקובץ המשותף הישן לשני ה-Stores (ids נשמרים),
+    ואז משנה את שמו ל-<name>.migrated כדי שלא ירוץ שוב. מחזיר {table: rows}.
+    """
+    legacy_path = Path(legacy_path)
+    if not legacy_path.exists():
+        return {}
+    # כמה workers של uvicorn עולים יחד: flock על קובץ צד, ובדיקה חוזרת בתוכו –
+    # מי שנכנס שני מוצא את הקובץ הישן כבר אחרי rename ויוצא
+    with open(legacy_path.with_name(legacy_path.name + ".lock"), "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if not legacy_path.exists():
+            return {}
+        return _migrate(legacy_path, otps, queue)
+
+def _migrate(legacy_path: Path, otps: Store, queue: Store) -> dict:
+    src = sqlite3.connect(legacy_path)
+    moved = {}
+    try:
+        tables = {r[0] for r in src.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if "otps" in tables:
+            moved["otps"] = _copy(src, otps, "otps", OTP_COLUMNS)
+        if "login_queue" in tables:
+            queue_schema(src)  # מביא את הטבלה הישנה לעמודות העדכניות לפני ההעתקה
+            src.commit()
+            moved["login_queue"] = _copy(src, queue, "login_queue", QUEUE_COLUMNS)
+        src.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        src.close()
+    with contextlib.suppress(FileNotFoundError):
+        legacy_path.rename(legacy_path.with_name(legacy_path.name + ".migrated"))
+    for suffix in ("-wal", "-shm"):
+        with contextlib.suppress(FileNotFoundError):
+            legacy_path.with_name(legacy_path.name + suffix).unlink()
+    return moved
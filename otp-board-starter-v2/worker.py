@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
-import os, time, json, contextlib, traceback, logging, requests, re
+import os, io, time, json, contextlib, traceback, logging, requests, re, base64, collections, queue, threading, functools, signal
+from datetime import datetime
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from zoneinfo import ZoneInfo
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
@@ -7,49 +11,353 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, WebDriverException
+
+import dom_probe
+
+try:  # אופציונלי: הקטנה/דחיסה של צילומי מסך
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:  # נעילת CHROME_CACHE_DIR בין תהליכי worker (POSIX)
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # =================== Config ===================
 OTP_API     = os.getenv("OTP_API", "https://mot-govisit-app.onrender.com")
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "MyStrongAdminToken")
 GOV_URL     = os.getenv("GOV_URL", "https://govisit.gov.il/he/app/appointment/29/1870/info")
 HEADERS     = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+LONG_POLL_SEC = int(os.getenv("LONG_POLL_SEC", "25"))  # השרת מחזיק את /api/login/next עד שמשימה זמינה; 0 = polling
 
 CHROME_BIN        = os.getenv("CHROME_BIN", "/usr/bin/chromium")
 CHROMEDRIVER_PATH = os.getenv("CHROMEDRIVER_PATH", "/usr/bin/chromedriver")
 HEADLESS_DEFAULT  = os.getenv("HEADLESS", "1").lower() in ("1", "true", "yes")
+# disk cache קבוע שנשמר בין דרייברים (הפרופיל עצמו זמני). ריק = cache בתוך הפרופיל, מתחיל קר בכל הפעלה
+CHROME_CACHE_DIR    = os.getenv("CHROME_CACHE_DIR", "")
+CHROME_CACHE_MAX_MB = int(os.getenv("CHROME_CACHE_MAX_MB", "256"))  # --disk-cache-size, רק עם CHROME_CACHE_DIR; 0 = ברירת המחדל של Chrome
 
 # Slots logging flags
 SLOTS_SCAN      = os.getenv("SLOTS_SCAN", "1").lower() in ("1", "true", "yes")
 SLOTS_DEEP      = os.getenv("SLOTS_DEEP", "0").lower() in ("1", "true", "yes")
 SLOTS_MAX_DAYS  = int(os.getenv("SLOTS_MAX_DAYS", "10"))
+# קריאת השעות מתגובות ה-XHR/fetch של האתר (CDP) במקום מה-DOM; נופל ל-DOM אם אין התאמה
+SLOTS_FROM_NETWORK = os.getenv("SLOTS_FROM_NETWORK", "0").lower() in ("1", "true", "yes")
+SLOTS_URL_RE       = re.compile(os.getenv("SLOTS_URL_RE", r"(?i)slot|availab|calendar|schedul|freetime|free-time"))
+SLOTS_TZ           = ZoneInfo(os.getenv("SLOTS_TZ", "Asia/Jerusalem"))
+
+# Waits: תדירות polling של WebDriverWait וחלון "שקט" (רשת + DOM) אחרי פעולות
+WAIT_POLL    = float(os.getenv("WAIT_POLL", "0.1"))
+WAIT_IDLE_MS = int(os.getenv("WAIT_IDLE_MS", "300"))
+# בקשות ארוכות (long-poll, keepalive של analytics) לא חוסמות "שקט": בקשה פתוחה מעבר ל-WAIT_LONG_REQUEST_MS
+# לא נספרת, ועד WAIT_MAX_INFLIGHT בקשות צעירות מותרות (0 = כמו networkidle0, 2 = networkidle2)
+WAIT_LONG_REQUEST_MS = int(os.getenv("WAIT_LONG_REQUEST_MS", "2000"))
+WAIT_MAX_INFLIGHT    = int(os.getenv("WAIT_MAX_INFLIGHT", "0"))
+
+# Resource policy: חסימת משאבים לא חיוניים ב-CDP (Network.setBlockedURLs)
+#   BLOCK_RESOURCES=image,font,media,analytics   BLOCK_URLS=*://cdn.example/*,*.gif
+BLOCK_RESOURCES = [t.strip().lower() for t in os.getenv("BLOCK_RESOURCES", "").split(",") if t.strip()]
+BLOCK_URLS      = [u.strip() for u in os.getenv("BLOCK_URLS", "").split(",") if u.strip()]
+# performance log של chromedriver: opt-in, נשמר ב-ring buffer חסום ומרוקן בסוף כל step
+PERF_LOG     = os.getenv("PERF_LOG", "0").lower() in ("1", "true", "yes")
+PERF_LOG_MAX = int(os.getenv("PERF_LOG_MAX", "5000"))
+PERF_LOG_ENABLED = PERF_LOG or SLOTS_FROM_NETWORK
+
+# Screenshots: נכתבים ב-thread ברקע לתיקייה מוגבלת בגודל
+SNAP_DIR        = os.getenv("SNAP_DIR", "/tmp/worker_snaps")
+SNAP_MODE       = os.getenv("SNAP_MODE", "all").lower()        # all | failures | off
+SNAP_SAMPLE_N   = max(1, int(os.getenv("SNAP_SAMPLE_N", "1")))  # צילומי הצלחה למשימה 1 מכל N
+SNAP_MAX_WIDTH  = int(os.getenv("SNAP_MAX_WIDTH", "0"))         # 0 = גודל מלא
+SNAP_FORMAT     = os.getenv("SNAP_FORMAT", "png").lower()       # png | jpeg
+SNAP_QUALITY    = int(os.getenv("SNAP_QUALITY", "70"))
+SNAP_DIR_MAX_MB = float(os.getenv("SNAP_DIR_MAX_MB", "200"))
+SNAP_QUEUE_MAX  = int(os.getenv("SNAP_QUEUE_MAX", "16"))
+
+# Tracing: trace לכל משימה בפורמט Chrome trace-event (Perfetto / chrome://tracing). ריק = כבוי
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+# ספירת פקודות WebDriver (round trips ל-chromedriver) וה-latency שלהן, לפי step
+DRIVER_STATS = os.getenv("DRIVER_STATS", "1").lower() in ("1", "true", "yes")
+# Profiling (כבוי כש-PROFILE_DIR ריק, כמו ב-server.py): cProfile על המשימה הבאה מקצה לקצה (קובץ pstats).
+# PROFILE_JOBS=N – N המשימות הראשונות; בזמן ריצה: kill -USR1 <pid> מסמן את המשימה הבאה
+PROFILE_DIR  = os.getenv("PROFILE_DIR", "")
+PROFILE_JOBS = int(os.getenv("PROFILE_JOBS", "0"))
+
+# Selector stats: איזה סלקטור הצליח לכל helper ודף; מנצחים מנוסים ראשונים. ריק = כבוי
+SELECTOR_STATS_FILE   = os.getenv("SELECTOR_STATS_FILE", "selector_stats.json")
+SELECTOR_HALF_LIFE_H  = float(os.getenv("SELECTOR_HALF_LIFE_H", "72"))   # דעיכת ניקוד
+
+# Metrics: listener מקומי עם /metrics (Prometheus text) ו-/healthz. 0 = כבוי
+METRICS_PORT     = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST     = os.getenv("METRICS_HOST", "127.0.0.1")
+HEALTH_STALE_SEC = float(os.getenv("HEALTH_STALE_SEC", "600"))  # בלי step שהסתיים בזמן הזה -> 503
 
 # =================== Logging ===================
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 LOGGER = logging.getLogger("worker")
 
+# =================== Tracing ===================
+_NULL_SPAN = contextlib.nullcontext()
+_trace = None      # רשימת האירועים של המשימה הנוכחית, None כשאין trace פעיל
+_trace_pid = 0
+
+@contextlib.contextmanager
+def _span(name, cat, args):
+    t0 = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        events = _trace
+        if events is not None:
+            ev = {"name": name, "cat": cat, "ph": "X", "ts": t0 // 1000,
+                  "dur": (time.perf_counter_ns() - t0) // 1000,
+                  "pid": _trace_pid, "tid": threading.get_native_id()}
+            if args:
+                ev["args"] = args
+            events.append(ev)
+
+def span(name: str, cat: str = "worker", **args):
+    if _trace is None:
+        return _NULL_SPAN
+    return _span(name, cat, args)
+
+def traced(fn):
+    """עוטף helper ב-span; כש-TRACE_DIR כבוי מחזיר את הפונקציה עצמה (אפס overhead)."""
+    if not TRACE_DIR:
+        return fn
+    @functools.wraps(fn)
+    def wrapper(*a, **kw):
+        with span(fn.__name__, "helper"):
+            return fn(*a, **kw)
+    return wrapper
+
+def trace_begin(job_id):
+    global _trace, _trace_pid
+    if TRACE_DIR:
+        _trace, _trace_pid = [], int(job_id)
+
+def trace_end():
+    global _trace
+    events, _trace = _trace, None
+    if events is None:
+        return
+    meta = [{"name": "process_name", "ph": "M", "pid": _trace_pid, "args": {"name": f"job #{_trace_pid}"}}]
+    tids = {ev["tid"] for ev in events}
+    for t in threading.enumerate():
+        # native_id (TID של מערכת ההפעלה, 32 ביט) – ident הוא כתובת pthread של 64 ביט ש-Perfetto לא מקבל
+        if t.native_id in tids:
+            meta.append({"name": "thread_name", "ph": "M", "pid": _trace_pid, "tid": t.native_id, "args": {"name": t.name}})
+    try:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        p = os.path.join(TRACE_DIR, f"job_{_trace_pid}_{int(time.time())}.json")
+        with open(p, "w") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f)
+        LOGGER.info("TRACE: %s (%d events)", p, len(events))
+    except Exception as e:
+        LOGGER.warning("TRACE write failed: %s", e)
+
+# ---- WebDriver command stats ----
+_STEP_STACK = []   # כותרות ה-step הפתוחים; הפנימי מקבל את הקרדיט על הפקודות
+_CMD_STATS = {}    # (step, command) -> [count, seconds]
+
+def _instrument_executor(driver):
+    """עוטף את ה-command executor: כל פקודת WebDriver נספרת/נמדדת תחת ה-step הנוכחי, וכ-span ב-trace."""
+    executor = driver.command_executor
+    orig = executor.execute
+    def execute(command, params):
+        t0 = time.perf_counter()
+        try:
+            with span(command, "webdriver"):
+                return orig(command, params)
+        finally:
+            if DRIVER_STATS:
+                key = (_STEP_STACK[-1] if _STEP_STACK else "-", command)
+                st = _CMD_STATS.get(key)
+                if st is None:
+                    st = _CMD_STATS[key] = [0, 0.0]
+                st[0] += 1
+                st[1] += time.perf_counter() - t0
+    executor.execute = execute
+
+def driver_stats_reset():
+    _CMD_STATS.clear()
+
+def log_driver_stats(job_id):
+    """סיכום הפקודות של המשימה: לפי step (הכי 'פטפטני' קודם) + שורת METRICS ב-JSON."""
+    if not DRIVER_STATS or not _CMD_STATS:
+        return
+    by_step, by_cmd = {}, {}
+    for (title, command), (n, sec) in _CMD_STATS.items():
+        st = by_step.setdefault(title, {"count": 0, "seconds": 0.0, "commands": collections.Counter()})
+        st["count"] += n
+        st["seconds"] += sec
+        st["commands"][command] += n
+        c = by_cmd.setdefault(command, {"count": 0, "seconds": 0.0})
+        c["count"] += n
+        c["seconds"] += sec
+    total_n = sum(c["count"] for c in by_cmd.values())
+    total_s = sum(c["seconds"] for c in by_cmd.values())
+    LOGGER.info("WD | job #%s | %d commands, %.1fs in chromedriver", job_id, total_n, total_s)
+    for title, st in sorted(by_step.items(), key=lambda kv: -kv[1]["count"]):
+        top = ", ".join(f"{c}={n}" for c, n in st["commands"].most_common(4))
+        LOGGER.info("WD | %-45s n=%-4d %.2fs | %s", title[:45], st["count"], st["seconds"], top)
+    LOGGER.info("METRICS %s", json.dumps({
+        "job": job_id,
+        "webdriver": {
+            "commands": total_n, "seconds": round(total_s, 3),
+            "by_command": {c: {"count": v["count"], "seconds": round(v["seconds"], 3)} for c, v in by_cmd.items()},
+            "by_step": {t: {"count": v["count"], "seconds": round(v["seconds"], 3), "commands": dict(v["commands"])}
+                        for t, v in by_step.items()},
+        },
+    }, ensure_ascii=False))
+
+# ---- Profiling ----
+_profile_pending = PROFILE_JOBS if PROFILE_DIR else 0   # כמה משימות הבאות לפרפל
+_profiler = None
+
+def request_profile(signum=None, frame=None):
+    """handler של SIGUSR1: לפרפל את המשימה הבאה (בטוח לקריאה מ-signal – רק מעלה מונה)."""
+    global _profile_pending
+    _profile_pending += 1
+
+def profile_begin(job_id):
+    global _profiler, _profile_pending
+    if _profile_pending <= 0:
+        return
+    _profile_pending -= 1
+    import cProfile
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+def profile_end(job_id):
+    global _profiler
+    prof, _profiler = _profiler, None
+    if prof is None:
+        return
+    prof.disable()
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        p = os.path.join(PROFILE_DIR, f"job_{job_id}_{int(time.time())}.pstats")
+        prof.dump_stats(p)
+        LOGGER.info("PROFILE: %s (python -m pstats / snakeviz)", p)
+    except Exception as e:
+        LOGGER.warning("PROFILE write failed: %s", e)
+
+# =================== Steps & snapshots ===================
+# callbacks(title, seconds, ok) שנקראים בסוף כל step (benchmark, metrics)
+STEP_HOOKS = []
+
 @contextlib.contextmanager
 def step(title: str):
     t0 = time.time()
+    ok = False
     LOGGER.info(">> %s", title)
+    _STEP_STACK.append(title)
     try:
-        yield
+        with span(title, "step"):
+            yield
+        ok = True
         LOGGER.info(">> %s (%.1fs)", title, time.time() - t0)
     except Exception:
         LOGGER.exception("FAIL %s (%.1fs)", title, time.time() - t0)
         raise
+    finally:
+        _STEP_STACK.pop()
+        if PERF_LOG_ENABLED:
+            drain_perf_log()
+        for hook in STEP_HOOKS:
+            with contextlib.suppress(Exception):
+                hook(title, time.time() - t0, ok)
 
-def dump_state(driver, tag: str):
-    try:
-        p = f"/tmp/worker_{int(time.time())}_{tag}.png"
-        driver.save_screenshot(p)
-        LOGGER.info("SNAP: %s", p)
-    except Exception:
-        pass
+def dump_state(driver, tag: str, failure: bool = False):
+    if _snap_wanted(failure):
+        try:
+            # רק הצילום עצמו על ה-critical path; קידוד, כתיבה ורוטציה ב-thread ברקע
+            _submit_snap(tag, driver.get_screenshot_as_png())
+        except Exception:
+            pass
     with contextlib.suppress(Exception):
         LOGGER.info("URL: %s | TITLE: %s", driver.current_url, driver.title)
 
+# ---- Screenshots ----
+_SNAP_QUEUE = queue.Queue(maxsize=SNAP_QUEUE_MAX)
+_SNAP_SEQ = collections.Counter()
+_snap_thread = None
+_snap_job_sampled = True   # ההחלטה נקבעת פעם אחת לכל משימה (snap_job_begin), לא לכל קריאה
+
+def snap_job_begin(job_no: int):
+    """משימה 1, 1+N, 1+2N... שומרת את כל צילומי ההצלחה שלה; השאר רק צילומי כשל."""
+    global _snap_job_sampled
+    _snap_job_sampled = (job_no - 1) % SNAP_SAMPLE_N == 0
+
+def _snap_wanted(failure: bool) -> bool:
+    if SNAP_MODE == "off":
+        return False
+    if failure:
+        return True
+    if SNAP_MODE == "failures":
+        return False
+    return _snap_job_sampled
+
+def _submit_snap(tag: str, png: bytes):
+    global _snap_thread
+    if _snap_thread is None:
+        _snap_thread = threading.Thread(target=_snap_writer, name="snap-writer", daemon=True)
+        _snap_thread.start()
+    try:
+        _SNAP_QUEUE.put_nowait((tag, time.time(), png))
+    except queue.Full:
+        LOGGER.warning("SNAP queue full, dropping %s", tag)
+
+def _encode_snap(png: bytes):
+    if Image is None or (not SNAP_MAX_WIDTH and SNAP_FORMAT == "png"):
+        return png, "png"
+    img = Image.open(io.BytesIO(png))
+    if SNAP_MAX_WIDTH and img.width > SNAP_MAX_WIDTH:
+        img = img.resize((SNAP_MAX_WIDTH, max(1, round(img.height * SNAP_MAX_WIDTH / img.width))))
+    buf = io.BytesIO()
+    if SNAP_FORMAT in ("jpg", "jpeg"):
+        img.convert("RGB").save(buf, "JPEG", quality=SNAP_QUALITY, optimize=True)
+        return buf.getvalue(), "jpg"
+    img.save(buf, "PNG", optimize=True)
+    return buf.getvalue(), "png"
+
+def _rotate_snaps():
+    files = [e for e in os.scandir(SNAP_DIR) if e.is_file() and e.name.startswith("worker_")]
+    files.sort(key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in files)
+    cap = SNAP_DIR_MAX_MB * 1024 * 1024
+    while files and total > cap:
+        e = files.pop(0)
+        with contextlib.suppress(OSError):
+            total -= e.stat().st_size
+            os.remove(e.path)
+
+def _snap_writer():
+    while True:
+        tag, ts, png = _SNAP_QUEUE.get()
+        try:
+            data, ext = _encode_snap(png)
+            os.makedirs(SNAP_DIR, exist_ok=True)
+            _SNAP_SEQ[tag] += 1
+            p = os.path.join(SNAP_DIR, f"worker_{int(ts * 1000)}_{tag}_{_SNAP_SEQ[tag]}.{ext}")
+            with open(p, "wb") as f:
+                f.write(data)
+            LOGGER.info("SNAP: %s (%.0fKB)", p, len(data) / 1024.0)
+            _rotate_snaps()
+        except Exception as e:
+            LOGGER.warning("SNAP %s failed: %s", tag, e)
+        finally:
+            _SNAP_QUEUE.task_done()
+
+def flush_snaps(timeout: float = 5.0):
+    end = time.time() + timeout
+    while _SNAP_QUEUE.unfinished_tasks and time.time() < end:
+        time.sleep(0.05)
+
 # =================== API helpers ===================
+@traced
 def http_get_json(url, params=None, timeout=15, retries=2):
     for i in range(retries + 1):
         try:
@@ -64,13 +372,15 @@ def http_get_json(url, params=None, timeout=15, retries=2):
             raise
 
 def fetch_next_login():
-    d = http_get_json(f"{OTP_API}/api/login/next", timeout=20, retries=1)
+    params = {"wait": LONG_POLL_SEC} if LONG_POLL_SEC > 0 else None
+    d = http_get_json(f"{OTP_API}/api/login/next", params=params, timeout=20 + LONG_POLL_SEC, retries=1)
     return d if d and d.get("id") else None
 
 def wait_for_otp(phone, timeout=240):
     end = time.time() + timeout
     while time.time() < end:
-        d = http_get_json(f"{OTP_API}/api/otp/latest", params={"phone": phone}, timeout=12, retries=0)
+        with span("poll /api/otp/latest", "otp"):
+            d = http_get_json(f"{OTP_API}/api/otp/latest", params={"phone": phone}, timeout=12, retries=0)
         if d and d.get("code"):
             return d["code"], d["id"]
         time.sleep(2.0)
@@ -80,9 +390,27 @@ def mark_used(otp_id):
     with contextlib.suppress(Exception):
         requests.post(f"{OTP_API}/api/otp/mark_used", params={"id": otp_id}, headers=HEADERS, timeout=10)
 
-def mark_login(job_id, status):
+def mark_login(job_id, status, reason=None):
+    # reason: קוד כשל (failure_reason); השרת מחליט לפיו אם להחזיר לתור עם backoff או להשאיר failed
+    params = {"id": job_id, "status": status}
+    if reason:
+        params["reason"] = reason
     with contextlib.suppress(Exception):
-        requests.post(f"{OTP_API}/api/login/mark", params={"id": job_id, "status": status}, headers=HEADERS, timeout=10)
+        requests.post(f"{OTP_API}/api/login/mark", params=params, headers=HEADERS, timeout=10)
+
+class JobFailed(RuntimeError):
+    """כשל צפוי בזרימה; str(e) הוא קוד הסיבה שנשלח לשרת (radware_blocked, no_continue_button...)."""
+
+def failure_reason(e: Exception) -> str:
+    if isinstance(e, JobFailed):
+        return str(e)
+    if isinstance(e, requests.exceptions.RequestException):
+        return "api_error"
+    if isinstance(e, TimeoutException):
+        return "otp_timeout" if "OTP timeout" in str(e) else "page_timeout"
+    if isinstance(e, WebDriverException):
+        return "driver_error"
+    return "error"
 
 # =================== Browser ===================
 def build_driver(headless: bool):
@@ -101,19 +429,26 @@ def build_driver(headless: bool):
         "--disable-gpu","--disable-extensions","--disable-software-rasterizer",
         "--no-zygote","--remote-allow-origins=*","--window-size=1280,900",
         "--lang=he-IL", f"--user-data-dir={profile_dir}",
-        f"--disk-cache-dir={profile_dir}/cache","--remote-debugging-port=9222",
+        f"--disk-cache-dir={cache_dir_for(profile_dir)}","--remote-debugging-port=9222",
         "--disable-blink-features=AutomationControlled",
         f"--user-agent={UA}",
     ]:
         opts.add_argument(flag)
+    if _CACHE["persistent"] and CHROME_CACHE_MAX_MB > 0:  # cache בפרופיל הזמני – בלי תקרה, כמו קודם
+        opts.add_argument(f"--disk-cache-size={CHROME_CACHE_MAX_MB * 1024 * 1024}")
     opts.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
     opts.add_experimental_option("useAutomationExtension", False)
     opts.binary_location = CHROME_BIN
-    opts.set_capability("goog:loggingPrefs", {"browser":"ALL","performance":"ALL"})
+    log_prefs = {"browser": "ALL"}
+    if PERF_LOG_ENABLED:
+        log_prefs["performance"] = "ALL"
+    opts.set_capability("goog:loggingPrefs", log_prefs)
 
     service = Service(CHROMEDRIVER_PATH)
     driver = webdriver.Chrome(service=service, options=opts)
     driver.set_page_load_timeout(60)
+    if TRACE_DIR or DRIVER_STATS:
+        _instrument_executor(driver)
 
     # simple stealth
     driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": """
@@ -122,14 +457,269 @@ def build_driver(headless: bool):
         Object.defineProperty(navigator, 'plugins',   {get: () => [1,2,3,4]});
         Object.defineProperty(navigator, 'languages', {get: () => ['he-IL','he','en-US','en']});
     """})
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _WAIT_HOOKS_JS})
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": _NET_HOOKS_JS})
     driver.execute_cdp_cmd("Network.enable", {})
     driver.execute_cdp_cmd("Network.setUserAgentOverride", {
         "userAgent": UA,
         "acceptLanguage": "he-IL,he;q=0.9,en-US;q=0.8,en;q=0.7",
         "platform": "Linux aarch64",
     })
+    blocked = blocked_url_patterns()
+    if blocked:
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked})
+        LOGGER.info("Resource policy: blocking %d URL pattern(s) (%s)", len(blocked), resource_policy_label())
+
+    global _perf_driver
+    _perf_driver = driver
+    metrics_driver(driver)
     return driver
 
+# ---- Disk cache ----
+# state: cold = דרייבר חדש עם cache ריק, restart = דרייבר חדש עם cache קיים, warm = הדרייבר כבר טען משימה
+_CACHE = {"dir": None, "persistent": False, "state": "cold"}
+_cache_lock_fd = None
+
+def _lock_cache_dir() -> bool:
+    """CHROME_CACHE_DIR בשימוש של דפדפן אחד בכל רגע; worker שני על אותו host נופל ל-cache בפרופיל."""
+    global _cache_lock_fd
+    if _cache_lock_fd is not None or fcntl is None:
+        return True
+    fd = None
+    try:
+        os.makedirs(CHROME_CACHE_DIR, exist_ok=True)
+        fd = os.open(os.path.join(CHROME_CACHE_DIR, ".worker.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError as e:
+        if fd is not None:
+            os.close(fd)
+        LOGGER.warning("CHROME_CACHE_DIR %s unavailable (%s); using a per-profile cache", CHROME_CACHE_DIR, e)
+        return False
+    _cache_lock_fd = fd
+    return True
+
+def cache_dir_for(profile_dir: str) -> str:
+    if CHROME_CACHE_DIR and _lock_cache_dir():
+        primed = any(n != ".worker.lock" for n in os.listdir(CHROME_CACHE_DIR))
+        _CACHE.update(dir=CHROME_CACHE_DIR, persistent=True, state="restart" if primed else "cold")
+    else:
+        _CACHE.update(dir=f"{profile_dir}/cache", persistent=False, state="cold")
+    return _CACHE["dir"]
+
+def cache_label() -> str:
+    return f"{'persistent' if _CACHE['persistent'] else 'profile'}/{_CACHE['state']}"
+
+# =================== Network policy & perf log ===================
+BLOCK_PRESETS = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp", "*.avif"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav", "*.m4a"],
+    "analytics": ["*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+                  "*hotjar.com*", "*connect.facebook.net*", "*clarity.ms*"],
+}
+
+# buffer ברירת המחדל של Resource Timing הוא 250 רשומות – מגדילים כדי שסיכום הבייטים יהיה שלם
+_NET_HOOKS_JS = "performance.setResourceTimingBufferSize && performance.setResourceTimingBufferSize(2000);"
+
+_PAGE_STATS_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const res = performance.getEntriesByType('resource');
+let bytes = nav ? (nav.transferSize || 0) : 0;
+// cache hit: גוף לא ריק שלא עבר ברשת. cross-origin בלי Timing-Allow-Origin מדווח 0 בכל השדות ולא נספר
+let cached = 0, sized = 0;
+for (const r of res) {
+    bytes += r.transferSize || 0;
+    if (r.decodedBodySize > 0) {
+        sized++;
+        if (r.transferSize === 0) cached++;
+    }
+}
+return {
+    load_ms: nav && nav.loadEventEnd ? Math.round(nav.loadEventEnd - nav.startTime) : null,
+    resources: res.length,
+    bytes: bytes,
+    cached: cached,
+    sized: sized,
+};
+"""
+
+_PERF_LOG = collections.deque(maxlen=PERF_LOG_MAX)
+_perf_driver = None
+
+def blocked_url_patterns():
+    pats = []
+    for kind in BLOCK_RESOURCES:
+        if kind not in BLOCK_PRESETS:
+            LOGGER.warning("Unknown BLOCK_RESOURCES type: %s", kind)
+        pats += BLOCK_PRESETS.get(kind, [])
+    return pats + BLOCK_URLS
+
+def resource_policy_label() -> str:
+    parts = list(BLOCK_RESOURCES) + ([f"+{len(BLOCK_URLS)}urls"] if BLOCK_URLS else [])
+    return ",".join(parts) or "off"
+
+def drain_perf_log(driver=None):
+    """מעביר את ה-performance log מ-chromedriver (שאחרת נערם בזיכרון) ל-ring buffer חסום."""
+    driver = driver or _perf_driver
+    if not PERF_LOG_ENABLED or driver is None:
+        return
+    try:
+        entries = driver.get_log("performance") or []
+    except Exception:
+        return
+    for entry in entries:
+        with contextlib.suppress(Exception):
+            _PERF_LOG.append(json.loads(entry["message"])["message"])
+
+def reset_perf_log(driver):
+    drain_perf_log(driver)
+    _PERF_LOG.clear()
+
+def perf_events(*methods):
+    return [m for m in _PERF_LOG if m.get("method") in methods]
+
+def log_job_network(driver):
+    """שורת NET לכל משימה: בייטים שהועברו וזמן טעינת הדף, עם/בלי resource policy."""
+    stats = {}
+    with contextlib.suppress(Exception):
+        stats = driver.execute_script(_PAGE_STATS_JS) or {}
+    load_ms = stats.get("load_ms")
+    if PERF_LOG_ENABLED:
+        # כל המשימה (כל הניווטים): תגובות מ-disk cache + בקשות שהוגשו מ-memory cache
+        drain_perf_log(driver)
+        requests_n = len(perf_events("Network.requestWillBeSent"))
+        nbytes = sum((m.get("params") or {}).get("encodedDataLength") or 0 for m in perf_events("Network.loadingFinished"))
+        blocked = sum(1 for m in perf_events("Network.loadingFailed") if (m.get("params") or {}).get("blockedReason"))
+        responses = perf_events("Network.responseReceived")
+        hit_ids = {(m.get("params") or {}).get("requestId") for m in perf_events("Network.requestServedFromCache")}
+        hit_ids |= {(m.get("params") or {}).get("requestId") for m in responses
+                    if ((m.get("params") or {}).get("response") or {}).get("fromDiskCache")}
+        hits, total = len(hit_ids), len(responses)
+        LOGGER.info("NET | policy=%s | cache=%s hit=%d/%d (%.0f%%) | requests=%d blocked=%d transferred=%.0fKB | page_load=%sms",
+                    resource_policy_label(), cache_label(), hits, total, 100.0 * hits / max(1, total),
+                    requests_n, blocked, nbytes / 1024.0, load_ms)
+    else:
+        # Resource Timing של הדף האחרון בלבד
+        hits, total = stats.get("cached") or 0, stats.get("sized") or 0
+        LOGGER.info("NET | policy=%s | cache=%s hit=%d/%d (%.0f%%) | resources=%s transferred=%.0fKB | page_load=%sms",
+                    resource_policy_label(), cache_label(), hits, total, 100.0 * hits / max(1, total),
+                    stats.get("resources"), (stats.get("bytes") or 0) / 1024.0, load_ms)
+    _CACHE["state"] = "warm"
+
+# =================== Waits ===================
+# מוזרק לכל מסמך חדש: בקשות fetch/XHR פתוחות (id -> זמן התחלה) וזמן השינוי האחרון ברשת וב-DOM.
+# lastMut – כל שינוי (wait_dom_change); lastShape – בלי שינויי טקסט בלבד, כדי ששעון/ספירה לאחור
+# שמתקתק בדף לא ימנע "שקט" לעולם
+_WAIT_HOOKS_JS = """
+(() => {
+    if (window.__wk) return;
+    const wk = window.__wk = {open: new Map(), seq: 0, lastNet: Date.now(), lastMut: Date.now(), lastShape: Date.now()};
+    const bump = () => { wk.lastNet = Date.now(); };
+    const begin = () => { const id = ++wk.seq; wk.open.set(id, Date.now()); bump(); return id; };
+    const end = (id) => { if (wk.open.delete(id)) bump(); };
+    const native = (fn, orig) => { try { fn.toString = orig.toString.bind(orig); } catch (e) {} return fn; };
+    const origFetch = window.fetch;
+    if (origFetch) {
+        window.fetch = native(function () {
+            const id = begin();
+            try {
+                return origFetch.apply(this, arguments).finally(() => end(id));
+            } catch (e) { end(id); throw e; }
+        }, origFetch);
+    }
+    const origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = native(function () {
+        const id = begin();
+        this.addEventListener('loadend', () => end(id), {once: true});
+        try {
+            return origSend.apply(this, arguments);
+        } catch (e) { end(id); throw e; }  // InvalidStateError / שגיאת רשת ב-XHR סינכרוני: loadend לא יגיע
+    }, origSend);
+    const textOnly = (r) => r.type === 'characterData'
+        || (r.type === 'childList' && [...r.addedNodes, ...r.removedNodes].every(n => n.nodeType === 3));
+    new MutationObserver((records) => {
+        wk.lastMut = Date.now();
+        if (!records.every(textOnly)) wk.lastShape = wk.lastMut;
+    }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+})();
+"""
+
+# ממתין בתוך הדפדפן (ללא round trips) עד שקט ברשת וב-DOM, או עד השינוי הבא ב-DOM
+_WAIT_ASYNC_JS = """
+const mode = arguments[0], netIdle = arguments[1], domIdle = arguments[2], cap = arguments[3];
+const longMs = arguments[4], maxInflight = arguments[5];
+const done = arguments[arguments.length - 1];
+let wk = window.__wk;
+if (!wk) {
+    wk = window.__wk = {open: new Map(), lastNet: 0, lastMut: Date.now(), lastShape: Date.now()};
+    new MutationObserver(() => { wk.lastMut = wk.lastShape = Date.now(); })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+}
+const t0 = Date.now(), mut0 = wk.lastMut;
+let busy = 0;
+(function tick() {
+    const now = Date.now();
+    busy = 0;
+    for (const started of wk.open.values()) if (now - started < longMs) busy++;
+    const ok = mode === 'change'
+        ? wk.lastMut !== mut0
+        : busy <= maxInflight && now - wk.lastNet >= netIdle && now - wk.lastShape >= domIdle
+          && document.readyState !== 'loading';
+    if (ok || now - t0 >= cap) {
+        return done({ok: ok, inflight: busy, open: wk.open.size, net_ms: now - wk.lastNet,
+                     dom_ms: now - wk.lastShape, ready: document.readyState});
+    }
+    setTimeout(tick, 25);
+})();
+"""
+
+_WAIT_STATS = {"count": 0, "waited": 0.0, "timeouts": 0}
+
+def _wait_in_page(driver, mode, net_idle_ms, dom_idle_ms, timeout) -> bool:
+    t0 = time.time()
+    end = t0 + timeout
+    ok, state = False, None
+    try:
+        while not ok and time.time() < end:
+            cap_ms = int(min(end - time.time(), 20.0) * 1000)
+            try:
+                state = driver.execute_async_script(_WAIT_ASYNC_JS, mode, net_idle_ms, dom_idle_ms, cap_ms,
+                                                    WAIT_LONG_REQUEST_MS, WAIT_MAX_INFLIGHT) or {}
+                ok = bool(state.get("ok"))
+            except Exception:
+                # ניווט באמצע ההמתנה (document unloaded) – ממשיכים על המסמך החדש
+                if mode == "change":
+                    return True
+                time.sleep(0.05)
+    finally:
+        _WAIT_STATS["count"] += 1
+        _WAIT_STATS["waited"] += time.time() - t0
+    if not ok and mode == "quiet":
+        # ה-cap המלא שולם: מה מנע שקט (בקשות צעירות פתוחות / DOM שמשתנה / טעינה)
+        _WAIT_STATS["timeouts"] += 1
+        LOGGER.info("WAIT timeout %.1fs | %s", timeout, state)
+    return ok
+
+@traced
+def wait_quiet(driver, idle_ms: int = WAIT_IDLE_MS, timeout: float = 5.0, dom_idle_ms: int = None) -> bool:
+    """ממתין ל-'network idle' (עד WAIT_MAX_INFLIGHT בקשות fetch/XHR צעירות פתוחות) ולשקט ב-DOM במשך idle_ms."""
+    return _wait_in_page(driver, "quiet", idle_ms, idle_ms if dom_idle_ms is None else dom_idle_ms, timeout)
+
+@traced
+def wait_dom_change(driver, timeout: float = 2.0) -> bool:
+    """חוזר מיד כשה-DOM משתנה (MutationObserver), או אחרי timeout."""
+    return _wait_in_page(driver, "change", 0, 0, timeout)
+
+@traced
+def wait_for_element(driver, selectors, timeout: float = 10.0, **rules):
+    """'element X appeared': בדיקה עם dom_probe, ובדיקה חוזרת רק אחרי שינוי ב-DOM."""
+    end = time.time() + timeout
+    while True:
+        el = dom_probe.first(driver, selectors, **rules)
+        if el is not None or time.time() >= end:
+            return el
+        wait_dom_change(driver, timeout=min(2.0, max(0.0, end - time.time())))
+
 def is_radware_page(driver) -> bool:
     try:
         title = (driver.title or "").lower()
@@ -144,6 +734,7 @@ def is_radware_page(driver) -> bool:
             return True
     return False
 
+@traced
 def wait_for_radware_to_clear(driver, timeout=90) -> bool:
     end = time.time() + timeout
     seen = False
@@ -172,99 +763,252 @@ def open_with_bypass(url: str, driver: webdriver.Chrome, headless: bool):
             driver.get(url)
         dump_state(driver, "after_open_visible")
         if not wait_for_radware_to_clear(driver, timeout=90):
-            dump_state(driver, "radware_stuck")
+            dump_state(driver, "radware_stuck", failure=True)
             return driver, False
         return driver, True
-    dump_state(driver, "radware_stuck")
+    dump_state(driver, "radware_stuck", failure=True)
     return driver, False
 
+# =================== Selector stats ===================
+# {helper: {page: {"how=sel": [score, last_ts]}}}; score דועך בחצי כל SELECTOR_HALF_LIFE_H שעות
+_SEL_STATS = None
+_sel_dirty = False
+
+def _sel_id(sel) -> str:
+    return f"{sel[0]}={sel[1]}"
+
+def _sel_score(rec, now) -> float:
+    score, last = rec
+    return score * 0.5 ** ((now - last) / (SELECTOR_HALF_LIFE_H * 3600.0))
+
+def _selector_stats() -> dict:
+    global _SEL_STATS
+    if _SEL_STATS is None:
+        _SEL_STATS = {}
+        if SELECTOR_STATS_FILE and os.path.exists(SELECTOR_STATS_FILE):
+            try:
+                with open(SELECTOR_STATS_FILE) as f:
+                    _SEL_STATS = json.load(f)
+            except Exception as e:
+                LOGGER.warning("Ignoring unreadable %s: %s", SELECTOR_STATS_FILE, e)
+    return _SEL_STATS
+
+def _ranked(stats: dict, selectors, now) -> list:
+    """אינדקסים לתוך selectors: לפי ניקוד דועך, ובתיקו לפי הסדר המקורי."""
+    return sorted(range(len(selectors)), key=lambda i: (-_sel_score(stats.get(_sel_id(selectors[i]), (0, now)), now), i))
+
+def selector_order(helper: str, page: str, selectors) -> list:
+    if not SELECTOR_STATS_FILE:
+        return list(selectors)
+    stats = _selector_stats().get(helper, {}).get(page)
+    if not stats:
+        return list(selectors)
+    return [selectors[i] for i in _ranked(stats, selectors, time.time())]
+
+def selector_orders(helper: str, selectors) -> dict:
+    """{page: [indices]} לכל הדפים המוכרים של ה-helper – נבחר בתוך dom_probe לפי location.pathname."""
+    if not SELECTOR_STATS_FILE:
+        return {}
+    now = time.time()
+    return {page: _ranked(stats, selectors, now) for page, stats in _selector_stats().get(helper, {}).items()}
+
+def selector_won(helper: str, page: str, sel):
+    global _sel_dirty
+    if not SELECTOR_STATS_FILE or not page:
+        return
+    rec = _selector_stats().setdefault(helper, {}).setdefault(page, {}).setdefault(_sel_id(sel), [0.0, time.time()])
+    now = time.time()
+    rec[0], rec[1] = _sel_score(rec, now) + 1.0, now
+    _sel_dirty = True
+
+def save_selector_stats():
+    """נכתב פעם אחת בסוף משימה; רשומות שדעכו כמעט לאפס נזרקות."""
+    global _sel_dirty
+    if not SELECTOR_STATS_FILE or not _sel_dirty:
+        return
+    now = time.time()
+    for helper in list(_SEL_STATS):
+        for page in list(_SEL_STATS[helper]):
+            recs = _SEL_STATS[helper][page]
+            for k in [k for k, rec in recs.items() if _sel_score(rec, now) < 0.01]:
+                del recs[k]
+            if not recs:
+                del _SEL_STATS[helper][page]
+        if not _SEL_STATS[helper]:
+            del _SEL_STATS[helper]
+    try:
+        tmp = f"{SELECTOR_STATS_FILE}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(_SEL_STATS, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, SELECTOR_STATS_FILE)
+        _sel_dirty = False
+    except Exception as e:
+        LOGGER.warning("Could not save %s: %s", SELECTOR_STATS_FILE, e)
+
+def _page_key(driver) -> str:
+    with contextlib.suppress(Exception):
+        return urlsplit(driver.current_url).path
+    return ""
+
+def probe_first(driver, helper: str, selectors, **rules):
+    """dom_probe.first עם סדר אדפטיבי לפי הדף, ורישום הסלקטור המנצח."""
+    el, idx, page = dom_probe.locate(driver, selectors, orders=selector_orders(helper, selectors), **rules)
+    if el is not None:
+        selector_won(helper, page, selectors[idx])
+    return el
+
+def probe_click(driver, helper: str, selectors, **rules) -> bool:
+    """כמו probe_first, אבל הסלקטור נרשם כמנצח רק אחרי שהקליק עצמו הצליח."""
+    rules.setdefault("scroll", True)
+    el, idx, page = dom_probe.locate(driver, selectors, orders=selector_orders(helper, selectors), **rules)
+    if el is None or not dom_probe.click(driver, el):
+        return False
+    selector_won(helper, page, selectors[idx])
+    return True
+
 # =================== Page actions ===================
+@traced
 def click_continue_from_info(wait: WebDriverWait) -> bool:
     selectors = [
         (By.ID, "continue_1870_29"),
         (By.XPATH, "//button[contains(normalize-space(.),'להמשך זימון')]"),
         (By.XPATH, "//a[contains(normalize-space(.),'להמשך זימון')]"),
     ]
-    for how, sel in selectors:
+    page = _page_key(wait._driver)
+    for how, sel in selector_order("click_continue_from_info", page, selectors):
         try:
             btn = wait.until(EC.element_to_be_clickable((how, sel)))
             try:
                 btn.click()
             except Exception:
                 wait._driver.execute_script("arguments[0].click();", btn)
+            selector_won("click_continue_from_info", page, (how, sel))
             return True
         except Exception:
             continue
     return False
 
+PHONE_INPUT_CSS = "input[type='tel'], input[name*='phone'], input[autocomplete='tel']"
+
+# pathname -> מיקום שדה הטלפון בדף (-1 = המסמך הראשי, אחרת אינדקס ה-iframe).
+# לפי path בלבד (כמו _page_key): query string של session לא מנפח את המילון שנשלח בכל בדיקה
+_PHONE_FRAME_CACHE = {}
+_PHONE_FRAME_CACHE_MAX = 64  # גם path עם טוקן session לא יגדל בלי סוף
+
+def _remember_phone_frame(page, idx):
+    _PHONE_FRAME_CACHE.pop(page, None)
+    _PHONE_FRAME_CACHE[page] = idx  # סוף סדר ההכנסה = בשימוש אחרון
+    while len(_PHONE_FRAME_CACHE) > _PHONE_FRAME_CACHE_MAX:
+        del _PHONE_FRAME_CACHE[next(iter(_PHONE_FRAME_CACHE))]
+
+# בודק בסיבוב אחד את המסמך הראשי ואת כל ה-iframe-ים הנגישים (same-origin).
+# iframe חוצה-מקור (contentDocument==null) מוחזר ב-opaque לבדיקה רגילה דרך switch_to.
+_FIND_PHONE_FRAME_JS = """
+const sel = arguments[0], hint = arguments[1] || {};
+const page = location.pathname;
+if (document.querySelector(sel)) return {page: page, idx: -1};
+const frames = [...document.getElementsByTagName('iframe')];
+const order = frames.map((_, i) => i);
+const h = hint[page];
+if (typeof h === 'number' && h >= 0 && h < frames.length) { order.splice(h, 1); order.unshift(h); }
+const opaque = [];
+for (const i of order) {
+    let doc = null;
+    try { doc = frames[i].contentDocument; } catch (e) {}
+    if (!doc) { opaque.push([i, frames[i]]); continue; }
+    try { if (doc.querySelector(sel)) return {page: page, idx: i, frame: frames[i]}; } catch (e) {}
+}
+return {page: page, idx: null, opaque: opaque};
+"""
+
+@traced
+def _locate_phone_frame(driver) -> bool:
+    driver.switch_to.default_content()
+    res = driver.execute_script(_FIND_PHONE_FRAME_JS, PHONE_INPUT_CSS, _PHONE_FRAME_CACHE) or {}
+    page, idx = res.get("page"), res.get("idx")
+    if idx == -1:
+        _remember_phone_frame(page, -1)
+        return True
+    if idx is not None:
+        driver.switch_to.frame(res["frame"])
+        _remember_phone_frame(page, idx)
+        return True
+    for i, fr in res.get("opaque") or []:
+        driver.switch_to.frame(fr)
+        if driver.find_elements(By.CSS_SELECTOR, PHONE_INPUT_CSS):
+            _remember_phone_frame(page, i)
+            return True
+        driver.switch_to.default_content()
+    return False
+
+@traced
 def switch_into_iframe_with_phone(driver, wait, timeout=30) -> bool:
-    end = time.time() + timeout
+    t0 = time.time()
+    end = t0 + timeout
+    probes = 0
     while time.time() < end:
+        probes += 1
         with contextlib.suppress(Exception):
-            driver.switch_to.default_content()
-            if driver.find_elements(By.CSS_SELECTOR, "input[type='tel'], input[name*='phone'], input[autocomplete='tel']"):
+            if _locate_phone_frame(driver):
+                LOGGER.info("phone field located after %d probe(s) (%.2fs)", probes, time.time() - t0)
                 return True
         with contextlib.suppress(Exception):
-            frames = driver.find_elements(By.TAG_NAME, "iframe")
-            for fr in frames:
-                driver.switch_to.default_content()
-                driver.switch_to.frame(fr)
-                if driver.find_elements(By.CSS_SELECTOR, "input[type='tel'], input[name*='phone'], input[autocomplete='tel']"):
-                    return True
             driver.switch_to.default_content()
-        time.sleep(0.5)
+        wait_dom_change(driver, timeout=0.5)
     driver.switch_to.default_content()
     return False
 
+@traced
 def fill_phone_and_send_sms(wait: WebDriverWait, phone: str) -> bool:
-    phone_input = wait.until(EC.visibility_of_element_located((
-        By.CSS_SELECTOR, "input[type='tel'], input[name*='phone'], input[autocomplete='tel']"
-    )))
+    phone_input = wait_for_element(wait._driver, [(By.CSS_SELECTOR, PHONE_INPUT_CSS)], timeout=30, enabled=True)
+    if phone_input is None:
+        return False
     phone_input.clear()
     phone_input.send_keys(phone)
 
-    xpaths = [
-        "//*[contains(normalize-space(.),'שלח') and contains(normalize-space(.),'קוד')]",
-        "//*[contains(normalize-space(.),'שלחו') and contains(normalize-space(.),'SMS')]",
-        "//*[contains(normalize-space(.),'קבלת קוד')]",
-        "//*[contains(normalize-space(.),'המשך') or contains(normalize-space(.),'כניסה')]",
+    # רק אלמנטים לחיצים: "//*[contains(.)]" תופס גם html/body/div עוטף שהטקסט נמצא בתוכם
+    clickable = "//*[self::button or self::a or @role='button']"
+    xpaths = [(By.XPATH, xp) for xp in [
+        f"{clickable}[contains(normalize-space(.),'שלח') and contains(normalize-space(.),'קוד')]",
+        f"{clickable}[contains(normalize-space(.),'שלחו') and contains(normalize-space(.),'SMS')]",
+        f"{clickable}[contains(normalize-space(.),'קבלת קוד')]",
+        f"{clickable}[contains(normalize-space(.),'המשך') or contains(normalize-space(.),'כניסה')]",
         "//button[@type='submit']",
-    ]
-    for xp in xpaths:
+        "//input[@type='submit' or @type='button'][contains(@value,'קוד') or contains(@value,'המשך') or contains(@value,'כניסה')]",
+    ]]
+    page = _page_key(wait._driver)
+    for sel in selector_order("fill_phone_and_send_sms", page, xpaths):
         try:
-            btn = wait.until(EC.element_to_be_clickable((By.XPATH, xp)))
+            btn = wait.until(EC.element_to_be_clickable(sel))
             try:
                 btn.click()
             except Exception:
                 wait._driver.execute_script("arguments[0].click();", btn)
+            selector_won("fill_phone_and_send_sms", page, sel)
             return True
         except Exception:
             continue
     return False
 
 # ===== OTP helpers =====
-def find_otp_input(driver):
-    sels = [
-        "input[autocomplete='one-time-code']",
-        "input[name*='code' i]",
-        "input[id*='code' i]",
-        "input[aria-label*='קוד']",
-        "input[placeholder*='קוד']",
-        "input[inputmode='numeric']",
-        "input[type='tel']",
-        "input[type='password']",
-        "input[type='text']",
-    ]
-    for sel in sels:
-        try:
-            els = driver.find_elements(By.CSS_SELECTOR, sel)
-            els = [e for e in els if e.is_displayed() and e.is_enabled()]
-            if els:
-                return els[0]
-        except Exception:
-            pass
-    return None
-
+OTP_INPUT_SELECTORS = [(By.CSS_SELECTOR, sel) for sel in [
+    "input[autocomplete='one-time-code']",
+    "input[name*='code' i]",
+    "input[id*='code' i]",
+    "input[aria-label*='קוד']",
+    "input[placeholder*='קוד']",
+    "input[inputmode='numeric']",
+    "input[type='tel']",
+    "input[type='password']",
+    "input[type='text']",
+]]
+OTP_BOX_SELECTORS = [(By.CSS_SELECTOR, "input[maxlength='1'], input[aria-label*='ספרה'], input[aria-label*='digit']")]
+
+@traced
+def find_otp_input(driver, scroll=False):
+    return probe_first(driver, "find_otp_input", OTP_INPUT_SELECTORS, enabled=True, scroll=scroll)
+
+@traced
 def enter_otp(wait: WebDriverWait, otp: str, timeout: int = 45) -> bool:
     """
     הזנת OTP – תומך בשדה יחיד או בקוביות (maxlength=1) ומדליק אירועי input/change.
@@ -275,12 +1019,8 @@ def enter_otp(wait: WebDriverWait, otp: str, timeout: int = 45) -> bool:
 
     end = time.time() + timeout
     while time.time() < end:
-        el = find_otp_input(d)
+        el = find_otp_input(d, scroll=True)
         if el:
-            try:
-                d.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-            except Exception:
-                pass
             with contextlib.suppress(Exception):
                 el.clear()
             with contextlib.suppress(Exception):
@@ -298,12 +1038,9 @@ def enter_otp(wait: WebDriverWait, otp: str, timeout: int = 45) -> bool:
 
         # נסיון לקוביות (תיבה לכל ספרה)
         try:
-            boxes = d.find_elements(By.CSS_SELECTOR,
-                "input[maxlength='1'], input[aria-label*='ספרה'], input[aria-label*='digit']")
-            boxes = [b for b in boxes if b.is_displayed() and b.is_enabled()]
-            if boxes and len(boxes) >= len(str(otp)):
-                with contextlib.suppress(Exception):
-                    d.execute_script("arguments[0].scrollIntoView({block:'center'});", boxes[0])
+            boxes = dom_probe.first(d, OTP_BOX_SELECTORS, enabled=True, scroll=True,
+                                    multiple=True, min_count=len(str(otp)))
+            if boxes:
                 for i, ch in enumerate(str(otp)):
                     with contextlib.suppress(Exception):
                         boxes[i].clear()
@@ -313,10 +1050,11 @@ def enter_otp(wait: WebDriverWait, otp: str, timeout: int = 45) -> bool:
         except Exception:
             pass
 
-        time.sleep(0.3)
+        wait_dom_change(d, timeout=min(2.0, max(0.0, end - time.time())))
 
     return False
 
+@traced
 def click_login_after_otp(wait: WebDriverWait) -> bool:
     """
     לוחץ על "התחברות" גם אם הכפתור מנוטרל: מסיר disabled/aria-disabled, מפעיל requestSubmit,
@@ -326,48 +1064,14 @@ def click_login_after_otp(wait: WebDriverWait) -> bool:
     labels_he = ["התחברות", "אישור", "כניסה", "המשך"]
     labels_en = ["Submit", "Continue", "Next", "Sign in", "Log in"]
 
-    def try_click(el):
-        try:
-            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-        except Exception:
-            pass
-        # לבטל נטרול
-        with contextlib.suppress(Exception):
-            driver.execute_script(
-                "arguments[0].removeAttribute('disabled');"
-                "arguments[0].setAttribute('aria-disabled','false');"
-                "arguments[0].classList && arguments[0].classList.remove('disabled');",
-                el
-            )
-        try:
-            el.click()
-            return True
-        except Exception:
-            with contextlib.suppress(Exception):
-                driver.execute_script("arguments[0].click();", el)
-                return True
-        return False
-
-    # 1) לפי טקסט בעברית/אנגלית
+    # 1) לפי טקסט בעברית/אנגלית, 2) כל submit זמין – בבדיקה אחת; מבטל נטרול לפני הקליק
+    sels = []
     for txt in labels_he + labels_en:
-        try:
-            btns = driver.find_elements(By.XPATH, f"//button[contains(normalize-space(.),'{txt}')]")
-            btns += driver.find_elements(By.XPATH, f"//*[self::button or self::a][contains(normalize-space(.),'{txt}')]")
-            for b in btns:
-                if b.is_displayed():
-                    if try_click(b):
-                        return True
-        except Exception:
-            pass
-
-    # 2) כל submit זמין
-    try:
-        for el in driver.find_elements(By.CSS_SELECTOR, "button[type='submit'], input[type='submit']"):
-            if el.is_displayed():
-                if try_click(el):
-                    return True
-    except Exception:
-        pass
+        sels.append((By.XPATH, f"//button[contains(normalize-space(.),'{txt}')]"))
+        sels.append((By.XPATH, f"//*[self::button or self::a][contains(normalize-space(.),'{txt}')]"))
+    sels.append((By.CSS_SELECTOR, "button[type='submit'], input[type='submit']"))
+    if probe_click(driver, "click_login_after_otp", sels, unblock=True):
+        return True
 
     # 3) בקשה ישירה ל-submit של הטופס
     try:
@@ -399,29 +1103,20 @@ def click_login_after_otp(wait: WebDriverWait) -> bool:
     return False
 
 # ---- ID & Filters helpers ----
-def find_id_input(driver):
-    label_phrases = ["מספר זהות", "תעודת זהות", "ת.ז"]
-    for phrase in label_phrases:
-        for xp in [
-            f"//label[contains(normalize-space(.),'{phrase}')]/following::input[1]",
-            f"//div[.//label[contains(normalize-space(.),'{phrase}')]]//input",
-        ]:
-            try:
-                el = driver.find_element(By.XPATH, xp)
-                if el.is_displayed():
-                    return el
-            except Exception:
-                pass
-    for sel in ["input[name*='id']", "input[inputmode='numeric']",
-                "input[aria-label*='זהות']", "input[placeholder*='זהות']"]:
-        try:
-            for el in driver.find_elements(By.CSS_SELECTOR, sel):
-                if el.is_displayed():
-                    return el
-        except Exception:
-            pass
-    return None
-
+ID_INPUT_SELECTORS = [(By.XPATH, xp.format(phrase)) for phrase in ["מספר זהות", "תעודת זהות", "ת.ז"] for xp in (
+    "//label[contains(normalize-space(.),'{}')]/following::input[1]",
+    "//div[.//label[contains(normalize-space(.),'{}')]]//input",
+)] + [(By.CSS_SELECTOR, sel) for sel in [
+    "input[name*='id']", "input[inputmode='numeric']",
+    "input[aria-label*='זהות']", "input[placeholder*='זהות']",
+]]
+
+@traced
+def find_id_input(driver, timeout: float = 10.0):
+    """ממתין (לפי שינויי DOM) עד שמסך הזהות מרונדר אחרי ההתחברות; None אם הוא לא מופיע."""
+    return wait_for_element(driver, ID_INPUT_SELECTORS, timeout=timeout)
+
+@traced
 def click_next_button(wait: WebDriverWait, timeout=15) -> bool:
     driver = wait._driver
     labels = ["השלב הבא", "הבא", "המשך", "Next", "Continue", "חפש תורים", "חיפוש", "חפש"]
@@ -444,30 +1139,17 @@ def click_next_button(wait: WebDriverWait, timeout=15) -> bool:
         except Exception:
             return False
 
+    sels = [(By.XPATH, f"//button[contains(normalize-space(.),'{t}')]") for t in labels]
+    sels.append((By.XPATH, "//input[@type='submit']"))
     while time.time() < end:
-        xps = [f"//button[contains(normalize-space(.),'{t}')]" for t in labels] + ["//input[@type='submit']"]
-        for xp in xps:
-            try:
-                for el in driver.find_elements(By.XPATH, xp):
-                    try:
-                        if not el.is_displayed(): continue
-                        if el.get_attribute("disabled") or (el.get_attribute("aria-disabled") or "").lower() in ("true","1"):
-                            continue
-                        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
-                        try:
-                            el.click()
-                        except Exception:
-                            driver.execute_script("arguments[0].click();", el)
-                        return True
-                    except Exception:
-                        continue
-            except Exception:
-                pass
+        if probe_click(driver, "click_next_button", sels, enabled=True, aria=True):
+            return True
         if try_request_submit():
             return True
-        time.sleep(0.3)
+        wait_dom_change(driver, timeout=min(2.0, max(0.0, end - time.time())))
     return False
 
+@traced
 def set_text(driver, el, value: str):
     el.click()
     el.send_keys(Keys.CONTROL, "a")
@@ -480,6 +1162,7 @@ def set_text(driver, el, value: str):
                               "arguments[0].dispatchEvent(new Event('change',{bubbles:true}));"
                               "arguments[0].blur && arguments[0].blur();", el)
 
+@traced
 def open_custom_select_and_choose(driver, box, wanted: str) -> bool:
     try:
         driver.execute_script("arguments[0].scrollIntoView({block:'center'});", box)
@@ -489,7 +1172,7 @@ def open_custom_select_and_choose(driver, box, wanted: str) -> bool:
         box.click()
     except Exception:
         driver.execute_script("arguments[0].click();", box)
-    time.sleep(0.3)
+    wait_quiet(driver, idle_ms=150, timeout=2.0)
     option_xps = [
         f"//*[@role='option' and contains(normalize-space(.),'{wanted}')]",
         f"//li[contains(normalize-space(.),'{wanted}')]",
@@ -497,7 +1180,7 @@ def open_custom_select_and_choose(driver, box, wanted: str) -> bool:
     ]
     for xp in option_xps:
         try:
-            opt = WebDriverWait(driver, 5).until(EC.element_to_be_clickable((By.XPATH, xp)))
+            opt = WebDriverWait(driver, 5, poll_frequency=WAIT_POLL).until(EC.element_to_be_clickable((By.XPATH, xp)))
             try:
                 opt.click()
             except Exception:
@@ -507,7 +1190,7 @@ def open_custom_select_and_choose(driver, box, wanted: str) -> bool:
             continue
     with contextlib.suppress(Exception):
         box.send_keys(wanted)
-        time.sleep(0.2)
+        wait_quiet(driver, idle_ms=150, timeout=2.0)
         box.send_keys(Keys.ENTER)
         return True
     return False
@@ -527,32 +1210,18 @@ def set_select_like(driver, container, wanted: str) -> bool:
             pass
     return open_custom_select_and_choose(driver, container, wanted)
 
+@traced
 def find_labeled_field(driver, label_words, prefer_select=False):
+    sels = []
     for word in label_words:
-        for xp in [
-            f"//label[contains(normalize-space(.),'{word}')]/following::*[(self::input or self::select or self::*[@role='combobox'])][1]",
-            f"//div[.//label[contains(normalize-space(.),'{word}')]]//*[self::input or self::select or self::*[@role='combobox']]",
-        ]:
-            try:
-                els = driver.find_elements(By.XPATH, xp)
-                for el in els:
-                    if el.is_displayed():
-                        return el
-            except Exception:
-                pass
+        sels.append((By.XPATH, f"//label[contains(normalize-space(.),'{word}')]/following::*[(self::input or self::select or self::*[@role='combobox'])][1]"))
+        sels.append((By.XPATH, f"//div[.//label[contains(normalize-space(.),'{word}')]]//*[self::input or self::select or self::*[@role='combobox']]"))
     if prefer_select:
-        try:
-            for el in driver.find_elements(By.CSS_SELECTOR, "[role='combobox'], select"):
-                if el.is_displayed(): return el
-        except Exception:
-            pass
-    try:
-        for el in driver.find_elements(By.CSS_SELECTOR, "input"):
-            if el.is_displayed(): return el
-    except Exception:
-        pass
-    return None
+        sels.append((By.CSS_SELECTOR, "[role='combobox'], select"))
+    sels.append((By.CSS_SELECTOR, "input"))
+    return dom_probe.first(driver, sels)
 
+@traced
 def fill_id_and_next(wait: WebDriverWait, id_number: str) -> bool:
     if not id_number:
         LOGGER.info("No id_number in payload, skipping ID step")
@@ -576,6 +1245,7 @@ def fill_id_and_next(wait: WebDriverWait, id_number: str) -> bool:
         return True
     return False
 
+@traced
 def fill_filters_and_next(wait: WebDriverWait, payload: dict) -> bool:
     """
     ממלא עיר/סניף/תאריך/שעות אם מסופקים ב-payload:
@@ -678,57 +1348,174 @@ def fill_filters_and_next(wait: WebDriverWait, payload: dict) -> bool:
 # =================== Slots logging ===================
 TIME_RE = re.compile(r"\b(?:[01]?\d|2[0-3]):[0-5]\d\b")
 
-def _el_text(driver, el):
+_SELECTED_DAY_XP = "//button[( @aria-pressed='true' or @aria-selected='true' or contains(@class,'selected') ) and string-length(normalize-space(.))<=2]"
+_DATE_HEADER_XP = "//*[self::h1 or self::h2 or self::h3 or self::div][contains(normalize-space(.),'תאריך') or contains(normalize-space(.),'יום') or contains(normalize-space(.),'חודש')]"
+_TIME_CANDIDATES_XP = ("//*[self::button or self::li or self::div or self::span]"
+                       "[contains(normalize-space(.),':') and not(@aria-disabled='true') and not(@disabled)]")
+_DAY_BUTTONS_XP = "//button[not(@disabled) and not(@aria-disabled='true') and normalize-space(.)!='' and string-length(normalize-space(.))<=2]"
+
+# מעבר אחד על הדף: תווית התאריך הנוכחי, כל השעות (TIME_RE) ואופציונלית רשימת כפתורי הימים
+_SCAN_SLOTS_JS = """
+const timeRe = new RegExp(arguments[0], 'g'), xps = arguments[1], withDays = arguments[2];
+function xp(q) {
+    const s = document.evaluate(q, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const out = [];
+    for (let i = 0; i < s.snapshotLength; i++) out.push(s.snapshotItem(i));
+    return out;
+}
+function txt(el) { return (el.innerText || '').trim() || (el.textContent || '').trim(); }
+let label = null;
+const sel = xp(xps.selected);
+if (sel.length) label = (sel[0].getAttribute('aria-label') || '').trim() || null;
+if (!label) for (const h of xp(xps.header)) { const t = txt(h); if (t) { label = t; break; } }
+const times = new Set();
+for (const el of xp(xps.times)) {
+    const t = txt(el);
+    if (t) for (const m of t.matchAll(timeRe)) times.add(m[0]);
+}
+const res = {label: label, times: [...times], days: []};
+if (withDays) {
+    const seen = new Set();
+    for (const b of xp(xps.days)) {
+        const l = (b.getAttribute('aria-label') || txt(b) || '').trim();
+        if (!l || seen.has(l)) continue;
+        seen.add(l);
+        res.days.push([l, b]);
+    }
+}
+return res;
+"""
+
+@traced
+def _scan_slots(driver, with_days=False):
+    """מחזיר (date_label, times, [(day_label, button), ...]) בקריאת execute_script אחת."""
+    xps = {"selected": _SELECTED_DAY_XP, "header": _DATE_HEADER_XP,
+           "times": _TIME_CANDIDATES_XP, "days": _DAY_BUTTONS_XP}
     try:
-        t = (el.text or "").strip()
-        if not t:
-            t = (el.get_attribute("textContent") or "").strip()
-        return t
+        res = driver.execute_script(_SCAN_SLOTS_JS, TIME_RE.pattern, xps, with_days) or {}
     except Exception:
-        return ""
-
-def _current_date_label(driver):
-    try:
-        sel = driver.find_elements(
-            By.XPATH,
-            "//button[( @aria-pressed='true' or @aria-selected='true' or contains(@class,'selected') ) and string-length(normalize-space(.))<=2]"
-        )
-        if sel:
-            a = sel[0].get_attribute("aria-label")
-            if a:
-                return a.strip()
-    except Exception:
-        pass
-    try:
-        headers = driver.find_elements(
-            By.XPATH,
-            "//*[self::h1 or self::h2 or self::h3 or self::div][contains(normalize-space(.),'תאריך') or contains(normalize-space(.),'יום') or contains(normalize-space(.),'חודש')]"
-        )
-        for h in headers:
-            txt = _el_text(driver, h)
-            if txt:
-                return txt
-    except Exception:
-        pass
-    return "תאריך לא מזוהה"
-
-def _extract_times_on_page(driver):
-    times = set()
-    try:
-        candidates = driver.find_elements(
-            By.XPATH,
-            "//*[self::button or self::li or self::div or self::span]"
-            "[contains(normalize-space(.),':') and not(@aria-disabled='true') and not(@disabled)]"
-        )
-        for el in candidates:
-            txt = _el_text(driver, el)
-            if not txt:
-                continue
-            for m in TIME_RE.findall(txt):
-                times.add(m)
-    except Exception:
-        pass
-    return sorted(times)
+        res = {}
+    label = res.get("label") or "תאריך לא מזוהה"
+    return label, sorted(set(res.get("times") or [])), [tuple(d) for d in res.get("days") or []]
+
+# ---- Slots from network responses ----
+ISO_DT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:[T ](\d{2}:\d{2})(?::\d{2}(?:\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?)?$")
+
+def _slot_responses(driver):
+    """(requestId, url) של תגובות XHR/fetch בפורמט JSON שה-URL שלהן תואם SLOTS_URL_RE."""
+    drain_perf_log(driver)
+    found = []
+    for msg in perf_events("Network.responseReceived"):
+        params = msg.get("params") or {}
+        resp = params.get("response") or {}
+        if params.get("type") not in ("XHR", "Fetch") or "json" not in (resp.get("mimeType") or ""):
+            continue
+        if SLOTS_URL_RE.search(resp.get("url") or ""):
+            found.append((params.get("requestId"), resp.get("url")))
+    return found
+
+def _split_iso(value: str):
+    """'2025-09-08' -> (date, None); '2025-09-08T08:30[:00][Z|+03:00]' -> (date, 'HH:MM') בשעון SLOTS_TZ."""
+    m = ISO_DT_RE.match(value.strip())
+    if not m:
+        return None, None
+    day, hm, tz = m.groups()
+    if hm and tz:
+        with contextlib.suppress(Exception):
+            dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00")).astimezone(SLOTS_TZ)
+            return dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M")
+    return day, hm
+
+# רק מבנים "בצורת slot" נספרים – לא כל חותמת זמן שמופיעה בתגובה (meta.generated, updatedAt...):
+#   {"2025-09-08": ["08:00", ...]}                      מפתח תאריך -> רשימת שעות / datetimes
+#   {"slots": [{"date": "...", "time": "08:00"}, ...]}  אובייקט עם שדה שעה מפורש, תחת מפתח slot-י
+#   [{"start": "2025-09-08T08:00:00+03:00"}, ...]       datetime מלא בשדה שעה
+_SLOT_TIME_KEYS = {"time", "start", "starttime", "from", "fromtime", "begin", "begintime",
+                   "slot", "slottime", "hour", "datetime", "startdatetime"}
+_SLOT_DATE_KEYS = {"date", "day", "slotdate"}
+_SLOT_CONTAINER_RE = re.compile(r"(?i)slot|times|hours|avail|free|appointment|schedul")
+_SLOT_WRAPPER_KEYS = {"data", "result", "results", "items", "payload", "response", "value", "days", "dates"}
+
+def _norm_key(k) -> str:
+    return re.sub(r"[^a-z]", "", str(k).lower())
+
+def _slot_value(v, day):
+    """ערך slot בודד -> (date, 'HH:MM'); datetime מלא, או HH:MM כשהתאריך ידוע מההקשר."""
+    if not isinstance(v, str):
+        return None, None
+    d, hm = _split_iso(v)
+    if d and hm:
+        return d, hm
+    if day and TIME_RE.fullmatch(v.strip()):
+        return day, v.strip().zfill(5)
+    return None, None
+
+def _slots_from_json(obj, day=None, slotty=True, out=None):
+    """
+    אוסף {date: {HH:MM}} ממבני slot בלבד. slotty = האם אנחנו תחת מפתח slot-י (או מפתח תאריך);
+    מפתח אחר (meta, user...) מאפס אותו, כך שחותמות זמן שם מתעלמות.
+    """
+    out = {} if out is None else out
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if _norm_key(k) in _SLOT_DATE_KEYS and isinstance(v, str):
+                d, hm = _split_iso(v)
+                if d and not hm:
+                    day = d
+        for k, v in obj.items():
+            nk = _norm_key(k)
+            kd, khm = _split_iso(str(k))
+            if kd and not khm:
+                _slots_from_json(v if isinstance(v, (dict, list)) else [v], kd, True, out)
+            elif nk in _SLOT_TIME_KEYS:
+                if slotty:
+                    for item in (v if isinstance(v, list) else [v]):
+                        d, hm = _slot_value(item, day)
+                        if d:
+                            out.setdefault(d, set()).add(hm)
+            elif isinstance(v, (dict, list)):
+                child = bool(_SLOT_CONTAINER_RE.search(str(k))) or (slotty and nk in _SLOT_WRAPPER_KEYS)
+                _slots_from_json(v, day, child, out)
+    elif isinstance(obj, list):
+        for v in obj:
+            if isinstance(v, str):
+                d, hm = _slot_value(v, day) if slotty else (None, None)
+                if d:
+                    out.setdefault(d, set()).add(hm)
+            else:
+                _slots_from_json(v, day, slotty, out)
+    return out
+
+def _slots_suspicious(slots) -> str:
+    """סיבה לחשד בתוצאת ה-JSON (ריק = נראה תקין): תאריך שעבר, שעה מחוץ לרשת של 5 דק', יותר מדי שעות."""
+    today = datetime.now(SLOTS_TZ).strftime("%Y-%m-%d")
+    for d, times in slots.items():
+        if d < today:
+            return f"past date {d}"
+        if len(times) > 200:
+            return f"{len(times)} times on {d}"
+        odd = [t for t in times if int(t[-2:]) % 5]
+        if odd:
+            return f"off-grid time {d} {odd[0]}"
+    return ""
+
+@traced
+def _slots_from_network(driver):
+    slots = {}
+    for request_id, url in _slot_responses(driver):
+        try:
+            body = driver.execute_cdp_cmd("Network.getResponseBody", {"requestId": request_id})
+            text = body.get("body") or ""
+            if body.get("base64Encoded"):
+                text = base64.b64decode(text).decode("utf-8", "replace")
+            data = json.loads(text)
+        except Exception:
+            continue
+        found = _slots_from_json(data)
+        LOGGER.info("SLOTS source %s -> %d day(s)", url, len(found))
+        for day, times in found.items():
+            slots.setdefault(day, set()).update(times)
+    return slots
 
 def _click_safely(driver, el):
     try:
@@ -740,13 +1527,32 @@ def _click_safely(driver, el):
     except Exception:
         driver.execute_script("arguments[0].click();", el)
 
-def log_available_slots(wait: WebDriverWait, deep_scan: bool = False, max_days: int = 10):
+@traced
+def log_available_slots(wait: WebDriverWait, deep_scan: bool = False, max_days: int = 10,
+                        from_network: bool = False):
     driver = wait._driver
     with contextlib.suppress(Exception):
         driver.switch_to.default_content()
 
-    date_label = _current_date_label(driver)
-    times_now = _extract_times_on_page(driver)
+    if from_network:
+        slots = _slots_from_network(driver)
+        why = _slots_suspicious(slots) if slots else ""
+        if why:
+            # אימות מול הדף: השעות שמוצגות כרגע חייבות להופיע בתוצאת ה-JSON
+            _, dom_times, _ = _scan_slots(driver)
+            net_times = set().union(*slots.values())
+            if dom_times and set(dom_times) <= net_times:
+                LOGGER.info("SLOTS | network result looks odd (%s) but matches the DOM", why)
+            else:
+                LOGGER.warning("SLOTS | network result rejected (%s; DOM shows %s)", why, ", ".join(dom_times) or "nothing")
+                slots = {}
+        if slots:
+            for day in sorted(slots):
+                LOGGER.info("SLOTS | %s | %s", day, ", ".join(sorted(slots[day])))
+            return
+        LOGGER.info("SLOTS | no usable network slots, falling back to DOM scan")
+
+    date_label, times_now, days = _scan_slots(driver, with_days=deep_scan)
     if times_now:
         LOGGER.info("SLOTS | %s | %s", date_label, ", ".join(times_now))
     else:
@@ -755,104 +1561,280 @@ def log_available_slots(wait: WebDriverWait, deep_scan: bool = False, max_days:
     if not deep_scan:
         return
 
+    # כפתורי הימים נאספים פעם אחת; רק אם הלוח רונדר מחדש (stale) אוספים שוב
     seen_days = set()
     scanned = 0
-    for _ in range(max_days * 2):
-        if scanned >= max_days:
-            break
+    relists = 0
+    while days and scanned < max_days:
+        label, target = days.pop(0)
+        if label in seen_days:
+            continue
+        seen_days.add(label)
         try:
-            day_buttons = driver.find_elements(
-                By.XPATH,
-                "//button[not(@disabled) and not(@aria-disabled='true') and normalize-space(.)!='' and string-length(normalize-space(.))<=2]"
-            )
-            target = None
-            for db in day_buttons:
-                label = db.get_attribute("aria-label") or _el_text(driver, db)
-                label = (label or "").strip()
-                if not label or label in seen_days:
-                    continue
-                target = db
-                break
-
-            if not target:
-                break
-
-            label = target.get_attribute("aria-label") or _el_text(driver, target)
-            label = (label or "").strip()
-            seen_days.add(label)
-
             _click_safely(driver, target)
-            time.sleep(0.4)
-
-            times = _extract_times_on_page(driver)
-            if times:
-                LOGGER.info("SLOTS | %s | %s", label or "?", ", ".join(times))
-            else:
-                LOGGER.info("SLOTS | %s | אין שעות", label or "?")
-            scanned += 1
+        except StaleElementReferenceException:
+            seen_days.discard(label)
+            relists += 1
+            if relists > max_days:
+                break
+            _, _, fresh = _scan_slots(driver, with_days=True)
+            days = [d for d in fresh if d[0] not in seen_days]
+            continue
         except Exception:
             continue
+        wait_quiet(driver, timeout=3.0)
+
+        _, times, _ = _scan_slots(driver)
+        if times:
+            LOGGER.info("SLOTS | %s | %s", label or "?", ", ".join(times))
+        else:
+            LOGGER.info("SLOTS | %s | אין שעות", label or "?")
+        scanned += 1
+
+# =================== Metrics ===================
+METRIC_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _hist():
+    return {"buckets": [0] * len(METRIC_BUCKETS), "sum": 0.0, "count": 0}
+
+_METRICS_LOCK = threading.Lock()
+_METRICS = {
+    "jobs": collections.Counter(),       # result -> n
+    "failures": collections.Counter(),   # reason -> n
+    "steps": {},                         # step -> histogram
+    "step_failures": collections.Counter(),
+    "otp_wait": _hist(),
+    "last_success": 0.0,
+    "heartbeat": time.time(),
+    "driver_pid": None,
+    "driver_started": 0.0,
+}
+
+def _observe(h, value: float):
+    for i, b in enumerate(METRIC_BUCKETS):
+        if value <= b:
+            h["buckets"][i] += 1
+    h["sum"] += value
+    h["count"] += 1
+
+def metrics_step(title: str, seconds: float, ok: bool):
+    """STEP_HOOKS callback; "OPEN https://..." נספר כ-"OPEN" כדי שהתוויות לא יתפוצצו."""
+    key = title.split(" http", 1)[0]
+    with _METRICS_LOCK:
+        _observe(_METRICS["steps"].setdefault(key, _hist()), seconds)
+        if not ok:
+            _METRICS["step_failures"][key] += 1
+        _METRICS["heartbeat"] = time.time()
+
+def metrics_job(result: str, reason: str = None):
+    with _METRICS_LOCK:
+        _METRICS["jobs"][result] += 1
+        if reason:
+            _METRICS["failures"][reason] += 1
+        if result == "done":
+            _METRICS["last_success"] = time.time()
+
+def metrics_otp_wait(seconds: float):
+    with _METRICS_LOCK:
+        _observe(_METRICS["otp_wait"], seconds)
+
+def metrics_driver(driver):
+    with _METRICS_LOCK:
+        _METRICS["driver_pid"] = getattr(getattr(getattr(driver, "service", None), "process", None), "pid", None)
+        _METRICS["driver_started"] = time.time()
+
+def _browser_rss_bytes(root_pid) -> int:
+    """RSS של chromedriver וכל הצאצאים שלו (chrome + renderers) מתוך /proc; 0 אם לא זמין."""
+    if not root_pid or not os.path.isdir("/proc"):
+        return 0
+    children = collections.defaultdict(list)
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        with contextlib.suppress(OSError, IndexError, ValueError):
+            with open(f"/proc/{d}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            children[ppid].append(int(d))
+    total, todo = 0, [root_pid]
+    while todo:
+        pid = todo.pop()
+        todo.extend(children.get(pid, ()))
+        with contextlib.suppress(OSError):
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+    return total
+
+def _label(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _render_hist(out, name, h, labels=""):
+    sep = "," if labels else ""
+    for b, n in zip(METRIC_BUCKETS, h["buckets"]):
+        out.append(f'{name}_bucket{{{labels}{sep}le="{b}"}} {n}')
+    out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {h["count"]}')
+    lbl = f"{{{labels}}}" if labels else ""
+    out.append(f"{name}_sum{lbl} {h['sum']:.3f}")
+    out.append(f"{name}_count{lbl} {h['count']}")
+
+def render_metrics() -> str:
+    with _METRICS_LOCK:
+        m = json.loads(json.dumps(_METRICS))  # snapshot; ה-RSS נקרא מחוץ ל-lock
+    now = time.time()
+    out = [
+        "# HELP worker_jobs_total Jobs finished, by result.",
+        "# TYPE worker_jobs_total counter",
+    ]
+    for result in sorted(set(m["jobs"]) | {"done", "failed"}):
+        out.append(f'worker_jobs_total{{result="{_label(result)}"}} {m["jobs"].get(result, 0)}')
+    out += ["# HELP worker_job_failures_total Failed jobs, by failure reason.",
+            "# TYPE worker_job_failures_total counter"]
+    for reason, n in sorted(m["failures"].items()):
+        out.append(f'worker_job_failures_total{{reason="{_label(reason)}"}} {n}')
+    out += ["# HELP worker_step_duration_seconds Duration of each step().",
+            "# TYPE worker_step_duration_seconds histogram"]
+    for key, h in sorted(m["steps"].items()):
+        _render_hist(out, "worker_step_duration_seconds", h, f'step="{_label(key)}"')
+    out += ["# HELP worker_step_failures_total Steps that raised, by step.",
+            "# TYPE worker_step_failures_total counter"]
+    for key, n in sorted(m["step_failures"].items()):
+        out.append(f'worker_step_failures_total{{step="{_label(key)}"}} {n}')
+    out += ["# HELP worker_otp_wait_seconds Time from SMS to OTP available on the board.",
+            "# TYPE worker_otp_wait_seconds histogram"]
+    _render_hist(out, "worker_otp_wait_seconds", m["otp_wait"])
+    out += ["# HELP worker_browser_rss_bytes Resident memory of chromedriver and its browser processes (sum of RSS).",
+            "# TYPE worker_browser_rss_bytes gauge",
+            f"worker_browser_rss_bytes {_browser_rss_bytes(m['driver_pid'])}",
+            "# HELP worker_driver_age_seconds Seconds since the current driver was started.",
+            "# TYPE worker_driver_age_seconds gauge",
+            f"worker_driver_age_seconds {now - m['driver_started'] if m['driver_started'] else 0:.1f}",
+            "# HELP worker_last_success_timestamp_seconds Unix time of the last successful job (0 = none yet).",
+            "# TYPE worker_last_success_timestamp_seconds gauge",
+            f"worker_last_success_timestamp_seconds {m['last_success']:.3f}",
+            "# HELP worker_last_step_timestamp_seconds Unix time the last step() finished.",
+            "# TYPE worker_last_step_timestamp_seconds gauge",
+            f"worker_last_step_timestamp_seconds {m['heartbeat']:.3f}"]
+    return "\n".join(out) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body, ctype):
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self._send(200, render_metrics(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/healthz":
+            with _METRICS_LOCK:
+                idle = time.time() - _METRICS["heartbeat"]
+            ok = idle < HEALTH_STALE_SEC
+            self._send(200 if ok else 503, json.dumps({"ok": ok, "idle_sec": round(idle, 1)}), "application/json")
+        else:
+            self._send(404, "not found\n", "text/plain")
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """מפעיל את ה-listener ב-thread daemon ורושם את ה-hook של ה-steps; מחזיר את השרת."""
+    srv = ThreadingHTTPServer((host, port), _MetricsHandler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    if metrics_step not in STEP_HOOKS:
+        STEP_HOOKS.append(metrics_step)
+    LOGGER.info("Metrics on http://%s:%d/metrics", host, srv.server_address[1])
+    return srv
 
 # =================== Main loop ===================
-def main():
+def main(max_jobs: int = None):
+    """לולאת ה-worker. max_jobs – לעצור אחרי N משימות (benchmark); None = לעולם לא."""
     LOGGER.info("Starting worker | GOV_URL=%s | HEADLESS=%s", GOV_URL, HEADLESS_DEFAULT)
+    if METRICS_PORT:
+        start_metrics_server()
     driver = build_driver(headless=HEADLESS_DEFAULT)
-    wait = WebDriverWait(driver, 30)
+    wait = WebDriverWait(driver, 30, poll_frequency=WAIT_POLL)
+    jobs_done = 0
+    if PROFILE_DIR and hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, request_profile)
 
     try:
-        while True:
+        while max_jobs is None or jobs_done < max_jobs:
+            t_poll = time.monotonic()
             with step("FETCH JOB"):
                 job = fetch_next_login()
             if not job:
-                time.sleep(1.0)
+                # long-poll שחזר מוקדם (שגיאת רשת, 5xx, שרת בלי wait) לא יהפוך ל-busy loop
+                time.sleep(max(0.0, 1.0 - (time.monotonic() - t_poll)))
                 continue
 
+            jobs_done += 1
             jid      = job["id"]
             phone    = job["phone"]
             payload  = job.get("payload") or {}
             id_num   = (payload.get("id_number") or "").strip()
             LOGGER.info("Job #%s for phone %s", jid, phone)
+            snap_job_begin(jobs_done)
+            trace_begin(jid)
+            profile_begin(jid)
+            driver_stats_reset()
+            if PERF_LOG_ENABLED:
+                reset_perf_log(driver)  # לא לערבב אירועים ממשימות קודמות
 
             try:
+                _WAIT_STATS.update(count=0, waited=0.0, timeouts=0)
+                logged_in = False
+                prev_driver = driver
                 driver, ok = open_with_bypass(GOV_URL, driver, headless=HEADLESS_DEFAULT)
+                if driver is not prev_driver:
+                    wait = WebDriverWait(driver, 30, poll_frequency=WAIT_POLL)
                 if not ok:
-                    raise RuntimeError("radware_blocked")
+                    raise JobFailed("radware_blocked")
 
                 with step("CLICK continue button"):
                     if not click_continue_from_info(wait):
-                        dump_state(driver, "no_continue_button")
-                        raise RuntimeError("continue button not found")
+                        dump_state(driver, "no_continue_button", failure=True)
+                        raise JobFailed("no_continue_button")
 
-                time.sleep(1.0)
+                wait_quiet(driver, timeout=5.0)
 
                 with step("FIND phone field (iframe aware)"):
                     if not switch_into_iframe_with_phone(driver, wait, timeout=40):
-                        dump_state(driver, "no_phone_iframe")
-                        raise RuntimeError("phone field not found")
+                        dump_state(driver, "no_phone_iframe", failure=True)
+                        raise JobFailed("no_phone_field")
 
                 with step("SEND SMS"):
                     if not fill_phone_and_send_sms(wait, phone):
-                        dump_state(driver, "no_sms_button")
-                        raise RuntimeError("could not trigger sms")
+                        dump_state(driver, "no_sms_button", failure=True)
+                        raise JobFailed("sms_not_sent")
 
                 with step("WAIT OTP"):
+                    t_otp = time.time()
                     otp, otp_id = wait_for_otp(phone)
+                    metrics_otp_wait(time.time() - t_otp)
                     LOGGER.info("OTP: %s", otp)
 
                 with step("ENTER OTP"):
                     if not enter_otp(wait, otp):
-                        dump_state(driver, "no_otp_fields")
-                        raise RuntimeError("otp fields not found")
+                        dump_state(driver, "no_otp_fields", failure=True)
+                        raise JobFailed("no_otp_fields")
 
                 with step("CLICK login after OTP"):
                     clicked = click_login_after_otp(wait)
-                    time.sleep(0.5)
+                    wait_quiet(driver, timeout=5.0)
                     # המתן לניווט מתוך מסך האימות
                     with contextlib.suppress(Exception):
-                        WebDriverWait(driver, 10).until(lambda d: "auth/verify" not in (d.current_url or ""))
+                        WebDriverWait(driver, 10, poll_frequency=WAIT_POLL).until(lambda d: "auth/verify" not in (d.current_url or ""))
 
                 mark_used(otp_id)
                 mark_login(jid, "done")
+                logged_in = True
 
                 with contextlib.suppress(Exception):
                     driver.switch_to.default_content()
@@ -865,21 +1847,35 @@ def main():
 
                 if SLOTS_SCAN:
                     with step("LIST available slots"):
-                        log_available_slots(wait, deep_scan=SLOTS_DEEP, max_days=SLOTS_MAX_DAYS)
+                        log_available_slots(wait, deep_scan=SLOTS_DEEP, max_days=SLOTS_MAX_DAYS,
+                                            from_network=SLOTS_FROM_NETWORK)
 
                 dump_state(driver, "done")
                 LOGGER.info("[OK] %s", phone)
+                LOGGER.info("WAITS | %d event-driven waits, %.1fs total, %d timed out",
+                            _WAIT_STATS["count"], _WAIT_STATS["waited"], _WAIT_STATS["timeouts"])
+                metrics_job("done")
 
             except Exception as e:
-                LOGGER.error("[FAIL] %s: %s", phone, e)
+                # אחרי התחברות מוצלחת (OTP כבר נוצל) לא מנסים שוב – ניסיון חוזר ישלח SMS נוסף
+                reason = "post_login" if logged_in else failure_reason(e)
+                LOGGER.error("[FAIL] %s (%s): %s", phone, reason, e)
                 traceback.print_exc()
-                mark_login(jid, "failed")
+                mark_login(jid, "failed", reason)
+                metrics_job("failed", reason)
                 with contextlib.suppress(Exception):
                     driver.switch_to.default_content()
+            finally:
+                profile_end(jid)
+                log_driver_stats(jid)
+                save_selector_stats()
+                log_job_network(driver)
+                trace_end()
 
     finally:
         with contextlib.suppress(Exception):
             driver.quit()
+        flush_snaps()
 
 if __name__ == "__main__":
     main()